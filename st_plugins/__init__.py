@@ -79,6 +79,11 @@ A plugin can also define and use extra variables. See each plugin's documentatio
 
 """
 import os
+import threading
+import time
+
+from collections import OrderedDict
+from functools import partial
 
 import sublime
 import sublime_plugin
@@ -86,9 +91,11 @@ import sublime_plugin
 root_folder = os.path.realpath(os.path.abspath(os.path.join(
     os.path.normpath(os.path.join(os.path.dirname(__file__), os.pardir)))))
 
+from python_utils import cmd_utils
 from python_utils import log_system
 from python_utils.sublime_text_utils import events
 from python_utils.sublime_text_utils import logger as logger_utils
+from python_utils.sublime_text_utils import queue
 from python_utils.sublime_text_utils import settings as settings_utils
 from python_utils.sublime_text_utils import utils
 
@@ -100,6 +107,24 @@ _log_file = log_system.generate_log_path(storage_dir=os.path.join(root_folder, "
 logger = logger_utils.SublimeLogger(logger_name=plugin_name, log_file=_log_file)
 settings = settings_utils.Settings(name_space=plugin_name, logger=logger)
 
+# NOTE: Commands whose modifications are limited to the lines where the carets are.
+incremental_commands = {
+    "commit_completion",
+    "delete_word",
+    "insert",
+    "insert_best_completion",
+    "insert_snippet",
+    "left_delete",
+    "right_delete",
+}
+history_commands = {
+    "redo",
+    "redo_or_repeat",
+    "soft_redo",
+    "soft_undo",
+    "undo",
+}
+
 
 def set_logging_level():
     try:
@@ -127,6 +152,8 @@ def on_settings_changed(settings, **kwargs):
     if settings.has_changed("general.logging_level"):
         set_logging_level()
 
+    executables.clear()
+
 
 class ProjectSettingsController(utils.ProjectSettingsController,
                                 sublime_plugin.EventListener):
@@ -155,6 +182,338 @@ class OdyseusPluginsToggleLoggingLevelCommand(settings_utils.SettingsToggleList,
     _ody_values_list = ["ERROR", "INFO", "DEBUG"]
 
 
+class ViewsStorage():
+    """Bounded storage of per-view states.
+
+    The least recently used states are discarded when the storage is full.
+
+    Parameters
+    ----------
+    factory : callable
+        Callable that creates the state of a view.
+    max_size : int, optional
+        Maximum number of views to store states for.
+    """
+
+    def __init__(self, factory, max_size=50):
+        self._factory = factory
+        self._max_size = max_size
+        self._states = OrderedDict()
+        # NOTE: States are accessed from both the main and the asynchronous threads.
+        self._lock = threading.Lock()
+
+    def __contains__(self, view):
+        return view.id() in self._states
+
+    def get(self, view):
+        """Get the state of a view. It's created if it doesn't exist.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+
+        Returns
+        -------
+        object
+            The state of the view.
+        """
+        view_id = view.id()
+
+        with self._lock:
+            try:
+                self._states.move_to_end(view_id)
+                return self._states[view_id]
+            except KeyError:
+                state = self._states[view_id] = self._factory()
+
+                while len(self._states) > self._max_size:
+                    self._states.popitem(last=False)
+
+                return state
+
+    def pop(self, view):
+        """Discard the state of a view.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        """
+        with self._lock:
+            self._states.pop(view.id(), None)
+
+    def values(self):
+        """Get all stored states.
+
+        Returns
+        -------
+        list
+            The stored states.
+        """
+        with self._lock:
+            return list(self._states.values())
+
+
+class AdaptiveScheduler():
+    """Debounce jobs adapting their delay to their measured run time and to the views size.
+
+    Jobs scheduled with the same scheduler replace each other until one of them is executed.
+    Jobs for views that are no longer visible are dropped.
+
+    Parameters
+    ----------
+    key : str
+        Debounce key.
+    max_delay : int, optional
+        Maximum delay in milliseconds.
+    load : float, optional
+        Fraction of time a job is allowed to keep the thread it runs on busy while its
+        scheduling is constantly triggered.
+    """
+
+    def __init__(self, key, max_delay=1000, load=0.5):
+        self._key = key
+        self._max_delay = max_delay
+        self._load = load
+        # NOTE: Exponential moving average of the run time (in milliseconds) per character.
+        self._cost = 0.0
+
+    def schedule(self, view, callback, delay=0):
+        """Schedule a job.
+
+        Parameters
+        ----------
+        view : sublime.View
+            The view the job is for.
+        callback : callable
+            The job.
+        delay : int, optional
+            Minimum delay in milliseconds.
+        """
+        expected_run_time = self._cost * view.size()
+        delay = max(delay, min(int(expected_run_time / self._load), self._max_delay))
+
+        queue.debounce(partial(self._run, view, callback), delay=delay, key=self._key)
+
+    def _run(self, view, callback):
+        if not view.is_valid():
+            return
+
+        window = view.window()
+
+        if window is None or window.active_view_in_group(window.get_view_index(view)[0]) != view:
+            return
+
+        start = time.perf_counter()
+        callback()
+        run_time = (time.perf_counter() - start) * 1000
+        self._cost = self._cost * 0.7 + (run_time / max(view.size(), 1)) * 0.3
+
+
+class ExecutablesCache():
+    """Cache of resolved executables.
+
+    Resolved executables are re-validated at most once per ``check_interval`` seconds by checking
+    the modification time of the executable. Executables that couldn't be resolved are
+    re-validated by checking the ``PATH`` environment variable and the modification time of
+    its directories.
+
+    Parameters
+    ----------
+    check_interval : int, optional
+        Seconds during which a cached result is used without validating it.
+    """
+
+    def __init__(self, check_interval=5):
+        self._check_interval = check_interval
+        self._executables = {}
+        self._path_stamp = None
+        self._path_checked_at = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Discard all cached results.
+        """
+        with self._lock:
+            self._executables.clear()
+
+    def resolve(self, cmd_id, cmd):
+        """Resolve an executable.
+
+        Parameters
+        ----------
+        cmd_id : str
+            ID of the command definition the executable belongs to.
+        cmd : str
+            An executable name or the full path to an executable. Variables should already be
+            substituted.
+
+        Returns
+        -------
+        None, str
+            The full path to the executable or None if it can't be executed.
+        """
+        key = (cmd_id, sublime.platform(), cmd)
+        now = time.time()
+
+        with self._lock:
+            entry = self._executables.get(key)
+
+        if entry is not None:
+            path, mtime, stamp, checked_at = entry
+
+            if now - checked_at < self._check_interval:
+                return path
+
+            if self._is_valid(path, mtime, stamp):
+                with self._lock:
+                    self._executables[key] = (path, mtime, stamp, now)
+
+                return path
+
+        # NOTE: The cmd_utils.can_exec is to not require the command to exist in PATH.
+        path = cmd if cmd_utils.can_exec(cmd) else cmd_utils.which(cmd)
+
+        with self._lock:
+            self._executables[key] = (path or None, self._get_mtime(path),
+                                      None if path else self._get_path_stamp(), now)
+
+        return path or None
+
+    def _is_valid(self, path, mtime, stamp):
+        if path:
+            return mtime is not None and self._get_mtime(path) == mtime
+
+        return stamp == self._get_path_stamp()
+
+    def _get_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime if path else None
+        except OSError:
+            return None
+
+    def _get_path_stamp(self):
+        now = time.time()
+
+        if self._path_stamp is None or now - self._path_checked_at >= self._check_interval:
+            path_env = os.environ.get("PATH", "")
+            self._path_stamp = (path_env, tuple(self._get_mtime(directory)
+                                                for directory in path_env.split(os.pathsep)))
+            self._path_checked_at = now
+
+        return self._path_stamp
+
+
+executables = ExecutablesCache()
+
+
+def get_executable_from_settings(cmd_id, view, exec_map):
+    """Get the first executable command defined in an exec_map.
+
+    Parameters
+    ----------
+    cmd_id : str
+        ID of the command definition.
+    view : None, sublime.View
+        A Sublime Text view used to substitute variables.
+    exec_map : list
+        List of command definitions for the current platform.
+
+    Returns
+    -------
+    str
+        The command with its variables substituted. An empty string if none of the commands
+        can be executed.
+    """
+    for _map in exec_map:
+        cmd = _map.get("cmd")
+
+        if not cmd:
+            continue
+
+        cmd = utils.substitute_variables(utils.get_view_context(view), cmd)
+
+        if executables.resolve(cmd_id, cmd):
+            return cmd
+
+    return ""
+
+
+def mark_modified_lines(view, key, state, ignored_commands=()):
+    """Store the lines modified by the last edit of a view as hidden regions.
+
+    Sublime Text keeps the stored regions in sync with later edits. Edits that aren't limited to
+    the lines where the carets are invalidate the state and discard the stored regions.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    key : str
+        Key of the hidden regions.
+    state : object
+        An object with a ``rows`` attribute (number of rows of the view after the previous edit or
+        None if unknown) and a ``valid`` attribute (whether the stored regions are reliable).
+    ignored_commands : set, optional
+        Commands whose modifications are neither stored nor invalidate the state.
+    """
+    rows = view.rowcol(view.size())[0]
+    prev_rows = state.rows
+    state.rows = rows
+
+    if not state.valid:
+        return
+
+    command = view.command_history(0, True)[0]
+
+    if command in ignored_commands:
+        return
+
+    # NOTE: Edits that add or remove more than one line per caret aren't local to the carets.
+    if command not in incremental_commands or prev_rows is None or \
+            abs(rows - prev_rows) > len(view.sel()):
+        state.valid = False
+        view.erase_regions(key)
+        return
+
+    modified = view.get_regions(key)
+
+    for sel in view.sel():
+        line = view.line(sel)
+        # NOTE: Include the previous line. Line breaks inserted or removed also modify it.
+        modified.append(line.cover(view.line(max(line.begin() - 1, 0))))
+
+    merged = []
+
+    for region in sorted(modified, key=lambda region: region.begin()):
+        if merged and region.begin() <= merged[-1].end() + 1:
+            merged[-1] = merged[-1].cover(region)
+        else:
+            merged.append(region)
+
+    view.add_regions(key, merged, "", "", sublime.HIDDEN)
+
+
+def on_threads_finished(threads, callback):
+    """Call a function in the main thread as soon as a list of threads finished.
+
+    Parameters
+    ----------
+    threads : list
+        List of started threads.
+    callback : callable
+        Function called without arguments.
+    """
+    def wait():
+        for thread in threads:
+            thread.join()
+
+        sublime.set_timeout(callback, 0)
+
+    threading.Thread(target=wait, daemon=True).start()
+
+
 def display_message_in_panel(view_or_window=None, title="", body="", file_path="", debug=False):
     if debug and settings.get("general.logging_level", "ERROR").lower() != "debug":
         return
@@ -86,13 +86,27 @@ Code formatter plugin
             }]
         }]
 
+- Formatting a view while it's already being formatted cancels the previous formatting, killing its running commands. Formatted text is discarded if the view is modified while it's being formatted.
 - All settings are **optional** except when stated otherwise:
 
     + ``disabled`` (:py:class:`bool`): This is a convenience setting. If one has several commands defined in ``exec_map``, setting the ``is_visible`` for each command is just annoying. Setting ``disabled`` to **true** is the same as setting ``is_visible`` to **false** on each defined command.
     + ``exec_map`` (:py:class:`dict`) (**Required**): A dictionary with only three (3) keys (``linux``, ``osx``, and ``windows`` - see :ref:`command-executables-note-reference`); all of which are optional. Each of these keys should contain a list of dictionaries which can accept the following options.
 
-        * ``cmd`` (:py:class:`str`) (**Required**): The command to run. It can be an executable name or the full path to an executable. See :ref:`common-variables-substitution-reference`.
+        * ``cmd`` (:py:class:`str`) (**Required** if ``pipeline`` isn't defined): The command to run. It can be an executable name or the full path to an executable. See :ref:`common-variables-substitution-reference`.
+        * ``pipeline`` (:py:class:`list`): A list of command IDs whose commands are executed in sequence, the output of each command is passed to the next one through an OS pipe (e.g. ``["odyseus_convert_to_html5", "odyseus_html_prettifier"]``). The view is updated only once with the output of the last command. The command used from each command ID is resolved the same way as when using it directly. Command IDs that define pipelines themselves can't be used. The ``cmd``, ``args`` and ``daemon`` options are ignored when ``pipeline`` is defined.
         * ``args`` (:py:class:`list`): Arguments to pass to ``cmd``. See :ref:`common-variables-substitution-reference`.
+        * ``daemon`` (:py:class:`dict`): Format using a long-lived formatter server instead of starting ``cmd`` on each invocation. This avoids paying the start up time of the formatter (e.g. Node.js based formatters) each time. Only servers implementing the **core_d** protocol (e.g. ``eslint_d``, ``prettier_d_slim``) are supported. If the server can't be used, ``cmd`` will be used. Possible options:
+
+            - ``start_cmd`` (:py:class:`list`) (**Required**): Command used to start the server (e.g. ``["prettier_d_slim", "start"]``). The server is started only when it isn't already running.
+            - ``port_file`` (:py:class:`str`) (**Required**): File in which the server stores its port and token (e.g. ``~/.prettier_d_slim``).
+            - ``args`` (:py:class:`list`): Arguments passed to the server on each request. If not specified, the arguments defined in ``args`` are used.
+            - ``timeout`` (:py:class:`int`): Seconds to wait for the server to start. If not specified, **10** seconds. Requests to the server use the ``timeout`` option of the command definition.
+
+        * ``timeout`` (:py:class:`int`): Seconds to wait for ``cmd`` (or the formatter server defined in ``daemon``) to finish. The command is killed when this time is exceeded. Set to **0** to wait indefinitely. If not specified, **60** seconds.
+        * ``range_args`` (:py:class:`list`): Arguments added to ``args`` for each range of lines modified since the file was last saved when formatting a whole file (e.g. ``["--lines={start_line}:{end_line}"]`` for ``clang-format``). This allows tools that support formatting line ranges to only format the modified lines. The following placeholders are replaced: ``{start_line}`` and ``{end_line}`` (1-based line numbers), ``{offset}`` and ``{length}`` (in bytes). If the modified lines can't be determined (e.g. after a multi-line paste or an undo), the arguments aren't added and the whole file is formatted. Ignored when ``pipeline`` is defined.
+        * ``cache`` (:py:class:`bool`): Whether to cache the formatted output. Formatting the same text with the same command, arguments and configuration files returns the cached output without executing the command. Configuration files found by the command by itself (e.g. a ``.prettierrc`` file in a parent folder) must be listed in ``config_files``, otherwise their modifications aren't noticed and outdated outputs are returned. The output of a ``pipeline`` isn't cached if any of its commands sets this option to **false**. If not specified, **true**.
+        * ``config_files`` (:py:class:`list`): Configuration files used by the command that aren't passed as arguments (e.g. files found by the command in the working directory). Cached outputs are discarded when these files or the files passed as arguments are modified. See :ref:`common-variables-substitution-reference`.
+        * ``batch_sentinel`` (:py:class:`str`): A comment in the language being formatted containing an ``{id}`` placeholder (e.g. ``/* ody-sentinel-{id} */``). If defined, multiple selections are joined with this comment and formatted in a single execution of ``cmd``. If the formatter removes or alters the comments, each selection is formatted separately.
 
     + ``whole_file_not_allowed`` (:py:class:`str` or :py:class:`list`): This setting is used to prevent formatting an entire file. Possible values:
 
@@ -104,25 +118,52 @@ Code formatter plugin
         * A string: A case insensitive name (partial match (e.g. **javascript**) or syntax file name (e.g. **JavaScript.sublime-syntax**)) of a file view's syntax.
         * A list of strings: A list of view syntaxes. It follows the same logic as setting a single string, but it allows to match several syntaxes.
 
+- Global settings for this plugin:
+
+    + ``code_formatter_cache.max_memory_size`` (:py:class:`int`): Maximum size in bytes of the formatted outputs cached in memory.
+    + ``code_formatter_cache.max_disk_size`` (:py:class:`int`): Maximum size in bytes of the formatted outputs cached on disk. Set to **0** to not cache outputs on disk.
+    + ``code_formatter_jobs.max_workers`` (:py:class:`int`): Maximum number of formatters executed at the same time (e.g. when formatting multiple selections).
+    + ``code_formatter_jobs.format_on_save`` (:py:class:`list`): List of command IDs used to format files when they are saved. The first command that is visible for a file (see ``is_visible``) and that is allowed to format the whole file (see ``whole_file_not_allowed``) is used. Files are formatted in the background after they stop being modified and the formatted text is applied when the file is saved. If the formatted text isn't ready when the file is saved, the file is saved unformatted and it's formatted and saved again as soon as the formatted text is ready.
+    + ``code_formatter_jobs.format_on_save_delay`` (:py:class:`int`): Milliseconds to wait after a file stops being modified to format it in the background.
+
 """
+import bisect
+import hashlib
+import json
 import os
 import re
+import socket
+import subprocess
 import threading
+import time
+
+from collections import OrderedDict
+from contextlib import ExitStack
 
 import sublime
 import sublime_plugin
 
 from . import display_message_in_panel
+from . import executables
+from . import history_commands
 from . import logger
+from . import mark_modified_lines
+from . import on_threads_finished
+from . import plugin_name
+from . import root_folder
 from . import settings
+from . import ViewsStorage
 from python_utils import cmd_utils
 from python_utils import misc_utils
-from python_utils.sublime_text_utils import merge_utils
+from python_utils.sublime_text_utils import events
+from python_utils.sublime_text_utils import queue
 from python_utils.sublime_text_utils import utils
 
 
 __all__ = [
     "OdyseusCodeFormatterCommand",
+    "OdyseusCodeFormatterFormatOnSaveListener",
+    "OdyseusCodeFormatterModifiedLinesListener",
     "OdyseusUpdateContentCommand"
 ]
 
@@ -131,6 +172,58 @@ Command `{cmd}`
 ```
 {stderr}
 ```"""
+_daemons = {}
+_daemons_lock = threading.Lock()
+_daemon_exit_re = re.compile(br"\n?# exit (\d+)\s*\Z")
+_cache = None
+_workers = None
+_cache_dir = os.path.join(root_folder, "tmp", "code_formatter_cache")
+_stream_chunk_size = 65536
+_jobs = {}
+# NOTE: Above these limits, diffing a formatted text or applying its hunks one by one is more
+# expensive than replacing the whole view content.
+_diff_max_lines = 200000
+_diff_max_hunks = 1000
+
+
+class FormatOnSaveStorageClass():
+    def __init__(self):
+        self.change_count = None
+        self.thread = None
+        self.formatted_content = None
+        self.save_when_ready = False
+        self.format_after_save = False
+
+
+# NOTE: The formatted text of whole files is stored. Keep it small.
+FormatOnSaveStorage = ViewsStorage(FormatOnSaveStorageClass, max_size=10)
+_modified_lines_key = "code_formatter-modified-lines"
+
+
+class ModifiedLinesStorageClass():
+    def __init__(self):
+        self.rows = None
+        self.valid = False
+
+
+ModifiedLinesStorage = ViewsStorage(ModifiedLinesStorageClass)
+_range_args_used = None
+
+
+@events.on("settings_changed")
+def on_settings_changed(settings, **kwargs):
+    global _cache
+    global _workers
+    global _range_args_used
+    global ModifiedLinesStorage
+    _cache = None
+    _workers = None
+    range_args_were_used = _range_args_used
+    _range_args_used = None
+
+    # NOTE: Modified lines aren't tracked while no command uses them. Start over.
+    if range_args_used() != range_args_were_used:
+        ModifiedLinesStorage = ViewsStorage(ModifiedLinesStorageClass)
 
 
 def get_settings(cmd_id, default={}):
@@ -151,11 +244,580 @@ def get_settings(cmd_id, default={}):
     return settings.get("code_formatter.%s" % cmd_id, default)
 
 
+def range_args_used():
+    """Check if a command definition uses the ``range_args`` option.
+
+    The command IDs are read from the settings files of this package. The result is cached until
+    the settings change.
+
+    Returns
+    -------
+    bool
+        Whether the lines modified in views need to be tracked.
+    """
+    global _range_args_used
+
+    if _range_args_used is None:
+        prefix = "code_formatter."
+        cmd_ids = set()
+
+        for resource in sublime.find_resources("%s.sublime-settings" % plugin_name):
+            try:
+                cmd_ids.update(key[len(prefix):]
+                               for key in sublime.decode_value(sublime.load_resource(resource))
+                               if key.startswith(prefix))
+            except Exception as err:
+                logger.debug("Error reading <%s>: %s" % (resource, err))
+
+        _range_args_used = any(
+            _map.get("range_args")
+            for cmd_id in cmd_ids
+            for _map in get_settings(cmd_id).get("exec_map", {}).get(sublime.platform(), [])
+        )
+
+    return _range_args_used
+
+
+def get_cmd_settings(view, cmd_id, allow_pipeline=True):
+    """Get the settings of the first available command of a command definition.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view used to substitute variables.
+    cmd_id : str
+        Command ID.
+    allow_pipeline : bool, optional
+        Whether to take into account command definitions that define a pipeline.
+
+    Returns
+    -------
+    bool
+        Halt execution.
+    dict
+        Command definition of an existent command.
+    """
+    if cmd_id is None or get_settings(cmd_id).get("disabled", False):
+        return False
+
+    settings_exec_map = utils.substitute_variables(
+        utils.get_view_context(view),
+        get_settings(cmd_id).get("exec_map", {}).get(sublime.platform(), [])
+    )
+
+    for _map in settings_exec_map:
+        if _map.get("pipeline"):
+            pipeline = allow_pipeline and get_pipeline_settings(view, _map["pipeline"])
+
+            if pipeline:
+                cmd_settings = misc_utils.merge_dict(get_cmd_defaults(), _map)
+                cmd_settings["cmd"] = pipeline[0]["cmd"]
+                cmd_settings["pipeline"] = pipeline
+                return cmd_settings
+
+            continue
+
+        if "cmd" not in _map or not _map["cmd"]:
+            continue
+
+        if executables.resolve(cmd_id, _map["cmd"]):
+            return misc_utils.merge_dict(get_cmd_defaults(), _map)
+
+    return False
+
+
+def get_cmd_defaults():
+    """Get default settings.
+
+    Returns
+    -------
+    dict
+        Default settings.
+    """
+    return {
+        "cmd": "",
+        "args": []
+    }
+
+
+def get_pipeline_settings(view, cmd_ids):
+    """Get the settings of the commands of a pipeline.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view used to substitute variables.
+    cmd_ids : list
+        Command IDs.
+
+    Returns
+    -------
+    bool
+        Halt execution. Some command isn't available.
+    list
+        Settings of each command.
+    """
+    pipeline = []
+
+    for cmd_id in cmd_ids:
+        cmd_settings = get_cmd_settings(view, cmd_id, allow_pipeline=False)
+
+        if not cmd_settings or not cmd_settings["cmd"]:
+            return False
+
+        cmd_settings["cmd_id"] = cmd_id
+        pipeline.append(cmd_settings)
+
+    return pipeline
+
+
+def format_whole_file_allowed(view, cmd_id):
+    """Format whole file allowed.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    cmd_id : str, optional
+        Command ID.
+
+    Returns
+    -------
+    bool
+        If it is allowed to format the whole content of a file.
+    """
+    whole_file_not_allowed = get_settings(cmd_id).get("whole_file_not_allowed", False)
+
+    if isinstance(whole_file_not_allowed, bool):
+        return not whole_file_not_allowed
+    else:
+        return not utils.has_right_syntax(view, view_syntaxes=whole_file_not_allowed)
+
+
+def is_cmd_visible(view, cmd_id):
+    """Check if a command is available for a view.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    cmd_id : str
+        Command ID.
+
+    Returns
+    -------
+    bool
+        If the command should be visible.
+    """
+    cmd_settings = get_cmd_settings(view, cmd_id)
+
+    if not cmd_settings:  # It might have "disabled" set to true.
+        return False
+
+    is_visible = get_settings(cmd_id).get("is_visible", True)
+
+    if isinstance(is_visible, bool):
+        return is_visible
+    else:
+        return utils.has_right_syntax(view, view_syntaxes=is_visible)
+
+
+class FormatterDaemon():
+    """Client of a long-lived formatter server implementing the core_d protocol.
+
+    Parameters
+    ----------
+    daemon_settings : dict
+        The ``daemon`` option of a command definition.
+    """
+
+    def __init__(self, daemon_settings):
+        self._start_cmd = daemon_settings["start_cmd"]
+        self._port_file = os.path.expanduser(daemon_settings["port_file"])
+        self._args = daemon_settings.get("args")
+        self._timeout = daemon_settings.get("timeout", 10)
+        self._lock = threading.Lock()
+
+    def _read_port_file(self):
+        """Read the port and the token of the server.
+
+        Returns
+        -------
+        None, tuple
+            The port and the token. None if the server isn't running.
+        """
+        try:
+            with open(self._port_file, "r", encoding="utf-8") as port_file:
+                port, token = port_file.read().split()[:2]
+
+            return int(port), token
+        except (OSError, ValueError):
+            return None
+
+    def _start(self, cwd):
+        """Start the server and wait for it to be ready.
+
+        Parameters
+        ----------
+        cwd : None, str
+            Working directory.
+
+        Returns
+        -------
+        tuple
+            The port and the token.
+
+        Raises
+        ------
+        RuntimeError
+            The server couldn't be started.
+        """
+        logger.debug("FormatterDaemon: Starting server: `%s`" % " ".join(self._start_cmd))
+
+        with cmd_utils.popen(self._start_cmd, logger=logger, cwd=cwd) as proc:
+            proc.communicate(timeout=self._timeout)
+
+        deadline = time.time() + self._timeout
+
+        while time.time() < deadline:
+            connection = self._read_port_file()
+
+            if connection is not None:
+                return connection
+
+            time.sleep(0.1)
+
+        raise RuntimeError("Formatter server didn't start: `%s`" % " ".join(self._start_cmd))
+
+    def _request(self, connection, text_content, args, cwd, timeout, on_connect):
+        """Send a formatting request to the server.
+
+        Parameters
+        ----------
+        connection : tuple
+            The port and the token of the server.
+        text_content : bytes
+            Text to format.
+        args : list
+            Arguments for the formatter.
+        cwd : str
+            Working directory.
+        timeout : None, int
+            Seconds to wait for the server to respond. None to wait indefinitely.
+        on_connect : None, callable
+            Called with the socket connected to the server.
+
+        Returns
+        -------
+        tuple
+            The formatter stdout and stderr.
+        """
+        port, token = connection
+        header = "%s %s %s\n" % (token, cwd, json.dumps(args))
+
+        with socket.create_connection(("127.0.0.1", port), timeout=self._timeout) as sock:
+            sock.settimeout(timeout)
+
+            if on_connect is not None:
+                on_connect(sock)
+
+            sock.sendall(header.encode("utf-8") + text_content)
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+
+            while True:
+                chunk = sock.recv(65536)
+
+                if not chunk:
+                    break
+
+                chunks.append(chunk)
+
+        output = b"".join(chunks)
+        match = _daemon_exit_re.search(output)
+
+        if match and int(match.group(1)) != 0:
+            return b"", output[:match.start()] or b"Formatter server exit code: " + match.group(1)
+
+        return output[:match.start()] if match else output, b""
+
+    def format(self, text_content, args, cwd, timeout=None, on_connect=None):
+        """Format text.
+
+        Parameters
+        ----------
+        text_content : bytes
+            Text to format.
+        args : list
+            Arguments of the command definition. Used if the daemon doesn't define its own.
+        cwd : None, str
+            Working directory.
+        timeout : None, int, optional
+            Seconds to wait for the server to respond. None to wait indefinitely.
+        on_connect : None, callable, optional
+            Called with the socket connected to the server. Shutting it down aborts the request.
+
+        Returns
+        -------
+        tuple
+            The formatter stdout and stderr.
+        """
+        cwd = cwd or os.path.expanduser("~")
+        args = self._args if self._args is not None else args
+
+        with self._lock:
+            connection = self._read_port_file() or self._start(cwd)
+
+        try:
+            return self._request(connection, text_content, args, cwd, timeout, on_connect)
+        except ConnectionRefusedError:
+            # NOTE: Stale port file. The server was stopped.
+            with self._lock:
+                connection = self._start(cwd)
+
+            return self._request(connection, text_content, args, cwd, timeout, on_connect)
+
+
+class FormatterCache():
+    """Cache of formatted outputs stored in memory and on disk.
+
+    Both storages discard the least recently used outputs when they exceed their maximum size.
+
+    Parameters
+    ----------
+    storage_dir : str
+        Directory in which to store the outputs on disk.
+    max_memory_size : int
+        Maximum size in bytes of the outputs stored in memory.
+    max_disk_size : int
+        Maximum size in bytes of the outputs stored on disk. Zero to disable the disk storage.
+    """
+
+    def __init__(self, storage_dir, max_memory_size, max_disk_size):
+        self._storage_dir = storage_dir
+        self._max_memory_size = max_memory_size
+        self._max_disk_size = max_disk_size
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, cmd_id, stages, executable_paths, text_content):
+        """Generate the key of an output.
+
+        Parameters
+        ----------
+        cmd_id : str
+            Command ID.
+        stages : list
+            A (cmd, cwd, config_files) tuple for each command executed. The command and its
+            arguments, its working directory and the configuration files used by it.
+        executable_paths : list
+            Full paths to the executables used by the command.
+        text_content : bytes
+            Text passed to the command.
+
+        Returns
+        -------
+        str
+            The key.
+        """
+        # NOTE: Arguments that are existent files (configuration files) and the executables
+        # are part of the fingerprint so their modification invalidates cached outputs.
+        # Relative paths are resolved against the working directory of the command.
+        fingerprint = []
+        paths = [(path, None) for path in executable_paths if path]
+
+        for cmd, cwd, config_files in stages:
+            for arg in cmd + config_files:
+                arg = str(arg)
+                paths.append((arg, cwd))
+
+                # NOTE: Arguments in the form --config=path.
+                if "=" in arg:
+                    paths.append((arg.split("=", 1)[1], cwd))
+
+        for path, cwd in paths:
+            path = os.path.expanduser(path)
+
+            if cwd and not os.path.isabs(path):
+                path = os.path.join(cwd, path)
+
+            if os.path.isfile(path):
+                try:
+                    stat = os.stat(path)
+                    fingerprint.append([path, stat.st_mtime, stat.st_size])
+                except OSError:
+                    pass
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([cmd_id, stages, fingerprint]).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text_content)
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Get an output.
+
+        Parameters
+        ----------
+        key : str
+            The key of the output.
+
+        Returns
+        -------
+        None, bytes
+            The output, if cached.
+        """
+        with self._lock:
+            try:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            except KeyError:
+                pass
+
+        if not self._max_disk_size:
+            return None
+
+        path = os.path.join(self._storage_dir, key)
+
+        try:
+            with open(path, "rb") as cache_file:
+                output = cache_file.read()
+
+            # NOTE: The modification time is used to discard the least recently used outputs.
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        self._store_in_memory(key, output)
+
+        return output
+
+    def set(self, key, output):
+        """Store an output.
+
+        Parameters
+        ----------
+        key : str
+            The key of the output.
+        output : bytes
+            The output.
+        """
+        self._store_in_memory(key, output)
+
+        if not self._max_disk_size or len(output) > self._max_disk_size:
+            return
+
+        try:
+            os.makedirs(self._storage_dir, exist_ok=True)
+
+            with open(os.path.join(self._storage_dir, key), "wb") as cache_file:
+                cache_file.write(output)
+
+            self._evict_from_disk()
+        except OSError as err:
+            logger.error("FormatterCache: %s" % str(err))
+
+    def _store_in_memory(self, key, output):
+        if len(output) > self._max_memory_size:
+            return
+
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+
+            self._memory[key] = output
+            self._memory_size += len(output)
+
+            while self._memory_size > self._max_memory_size:
+                self._memory_size -= len(self._memory.popitem(last=False)[1])
+
+    def _evict_from_disk(self):
+        entries = []
+        total_size = 0
+
+        for name in os.listdir(self._storage_dir):
+            path = os.path.join(self._storage_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total_size <= self._max_disk_size:
+                break
+
+            os.remove(path)
+            total_size -= size
+
+
+def get_cache():
+    """Get the formatted outputs cache.
+
+    Returns
+    -------
+    FormatterCache
+        The cache.
+    """
+    global _cache
+
+    if _cache is None:
+        _cache = FormatterCache(
+            _cache_dir,
+            settings.get("code_formatter_cache.max_memory_size", 16777216),
+            settings.get("code_formatter_cache.max_disk_size", 67108864)
+        )
+
+    return _cache
+
+
+def get_workers():
+    """Get the semaphore limiting the number of formatters executed at the same time.
+
+    Returns
+    -------
+    threading.BoundedSemaphore
+        The semaphore.
+    """
+    global _workers
+
+    if _workers is None:
+        _workers = threading.BoundedSemaphore(
+            max(1, settings.get("code_formatter_jobs.max_workers", 4)))
+
+    return _workers
+
+
+def get_daemon(daemon_settings):
+    """Get the client of a formatter server.
+
+    Parameters
+    ----------
+    daemon_settings : dict
+        The ``daemon`` option of a command definition.
+
+    Returns
+    -------
+    FormatterDaemon
+        The client of the server. Clients are shared by all commands using the same server.
+    """
+    key = (tuple(daemon_settings["start_cmd"]), daemon_settings["port_file"])
+
+    with _daemons_lock:
+        try:
+            return _daemons[key]
+        except KeyError:
+            daemon = _daemons[key] = FormatterDaemon(daemon_settings)
+            return daemon
+
+
 class ThreadCall(threading.Thread):
     """Thread.
 
     Attributes
     ----------
+    cancelled : bool
+        Whether the execution was cancelled.
     error : str
         Error message.
     formatted_content : bool, str
@@ -187,13 +849,95 @@ class ThreadCall(threading.Thread):
         self._cmd.extend(cmd_settings.get("args", []))
         self._cwd = cmd_settings.get("cwd") or \
             (os.path.dirname(self._file_path) if self._file_path else None)
+        # NOTE: A list of (cmd, cwd) tuples. The STDOUT of each command is piped to the next one.
+        self._stages = [(self._cmd, self._cwd)]
+
+        if cmd_settings.get("pipeline"):
+            self._stages = [([stage["cmd"]] + stage.get("args", []), stage.get("cwd") or self._cwd)
+                            for stage in cmd_settings["pipeline"]]
+            self._cmd = []
+
+            for cmd, cwd in self._stages:
+                self._cmd.extend((["|"] if self._cmd else []) + cmd)
 
         self.text_content = text_content.encode("utf-8")
         self.region = region
         self.formatted_content = None
         self.error = ""
+        self.cancelled = False
+        self._procs = []
+        self._sock = None
+        self._timed_out = False
         threading.Thread.__init__(self)
 
+    def cancel(self):
+        """Cancel the execution, killing the command if it's running.
+        """
+        self.cancelled = True
+        self._kill()
+
+    def _kill(self):
+        for proc in list(self._procs):
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+        sock = self._sock
+
+        if sock is not None:
+            # NOTE: Shutting down the socket unblocks the thread waiting for the server response.
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _set_socket(self, sock):
+        self._sock = sock
+
+        if self.cancelled or self._timed_out:
+            self._kill()
+
+    def _on_timeout(self):
+        self._timed_out = True
+        self._kill()
+
+    def _get_executable_paths(self):
+        """Get the full paths to the executables used by the command.
+
+        Returns
+        -------
+        list
+            The paths. None for executables that can't be resolved.
+        """
+        stages = self._cmd_settings.get("pipeline") or [self._cmd_settings]
+
+        return [executables.resolve(stage.get("cmd_id"), stage.get("cmd", "")) for stage in stages]
+
+    def _get_cache_key(self):
+        """Get the key of the output of the command in the formatted outputs cache.
+
+        Returns
+        -------
+        None, str
+            The key. None if the output of the command shouldn't be cached.
+        """
+        pipeline = self._cmd_settings.get("pipeline") or []
+
+        if not all(stage.get("cache", True) for stage in [self._cmd_settings] + pipeline):
+            return None
+
+        stage_settings = pipeline or [self._cmd_settings]
+        stages = [(cmd, cwd, stage.get("config_files", []))
+                  for (cmd, cwd), stage in zip(self._stages, stage_settings)]
+
+        # NOTE: Configuration files listed in the pipeline definition itself.
+        if pipeline and self._cmd_settings.get("config_files"):
+            stages.append(([], self._cwd, self._cmd_settings["config_files"]))
+
+        return get_cache().make_key(self._cmd_settings.get("cmd_id"), stages,
+                                    self._get_executable_paths(), self.text_content)
+
     def read_output(self, output):
         """Read output.
 
@@ -209,6 +953,198 @@ class ThreadCall(threading.Thread):
         """
         return str(output, encoding="utf-8")
 
+    def communicate(self):
+        """Pass the text to the command.
+
+        The text is formatted by a formatter server if one is defined and it can be used.
+
+        Returns
+        -------
+        tuple
+            The command stdout and stderr.
+        """
+        daemon_settings = self._cmd_settings.get("daemon")
+
+        if daemon_settings and len(self._stages) == 1:
+            timeout = self._cmd_settings.get("timeout", 60)
+            watchdog = threading.Timer(timeout, self._on_timeout) if timeout else None
+            output = None
+
+            if watchdog is not None:
+                watchdog.start()
+
+            try:
+                output = get_daemon(daemon_settings).format(
+                    self.text_content, self._cmd[1:], self._cwd,
+                    timeout=timeout or None, on_connect=self._set_socket)
+            except Exception as err:
+                if not self.cancelled and not self._timed_out:
+                    logger.error("Formatter server failure. Falling back to `%s`.\n%s" %
+                                 (self._cmd[0], str(err)))
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+
+                self._sock = None
+
+            if self.cancelled:
+                return b"", b"Formatting cancelled."
+
+            if self._timed_out:
+                return b"", ("Formatter server request aborted after %d seconds." %
+                             timeout).encode("utf-8")
+
+            if output is not None:
+                return output
+
+        return self._stream()
+
+    def _stream(self):
+        """Stream the text to the command and read its output incrementally.
+
+        STDIN is written in chunks from another thread while STDOUT is read into a buffer
+        preallocated with the size of the text, so the text and the output aren't copied around.
+        In a pipeline, the commands are connected with OS pipes and only the STDOUT of the last
+        command is read.
+
+        Returns
+        -------
+        tuple
+            The command stdout and stderr.
+        """
+        # NOTE: The execution might have been cancelled while waiting for a free worker.
+        if self.cancelled:
+            return b"", b"Formatting cancelled."
+
+        timeout = self._cmd_settings.get("timeout", 60)
+        stderr = [b""] * len(self._stages)
+        threads = []
+
+        def read_stderr(index, proc):
+            stderr[index] = proc.stderr.read()
+
+        with ExitStack() as stack:
+            for index, (cmd, cwd) in enumerate(self._stages):
+                if self._procs:
+                    proc = stack.enter_context(self._popen_stage(cmd, cwd, self._procs[-1].stdout))
+                else:
+                    proc = stack.enter_context(cmd_utils.popen(cmd,
+                                                               logger=logger,
+                                                               bufsize=_stream_chunk_size,
+                                                               cwd=cwd))
+
+                if self._procs:
+                    # NOTE: The pipe now belongs to the next command. Closing it here allows the
+                    # previous command to receive SIGPIPE if the next one exits early.
+                    self._procs[-1].stdout.close()
+
+                self._procs.append(proc)
+                threads.append(threading.Thread(target=read_stderr, args=(index, proc),
+                                                 daemon=True))
+
+            if self.cancelled:
+                self._kill()
+
+            watchdog = threading.Timer(timeout, self._on_timeout) if timeout else None
+            threads.append(threading.Thread(target=self._write_stdin, args=(self._procs[0],),
+                                            daemon=True))
+
+            if watchdog is not None:
+                watchdog.start()
+
+            for thread in threads:
+                thread.start()
+
+            try:
+                stdout = self._read_stdout(self._procs[-1])
+
+                for thread in threads:
+                    thread.join()
+
+                for proc in self._procs:
+                    proc.wait()
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+
+                self._procs = []
+
+        if self.cancelled:
+            return b"", b"Formatting cancelled."
+
+        if self._timed_out:
+            return b"", ("Command killed after %d seconds." % timeout).encode("utf-8")
+
+        return stdout, b"".join(stderr)
+
+    def _popen_stage(self, cmd, cwd, stdin):
+        """Start a pipeline command reading from the STDOUT of the previous command.
+
+        Parameters
+        ----------
+        cmd : list
+            The command and its arguments.
+        cwd : None, str
+            Working directory.
+        stdin : file
+            STDOUT of the previous command.
+
+        Returns
+        -------
+        subprocess.Popen
+            The started command.
+        """
+        startupinfo = None
+
+        if os.name == "nt":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        return subprocess.Popen(cmd,
+                                stdin=stdin,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                bufsize=_stream_chunk_size,
+                                cwd=cwd,
+                                startupinfo=startupinfo)
+
+    def _write_stdin(self, proc):
+        text_content = memoryview(self.text_content)
+
+        try:
+            for start in range(0, len(text_content), _stream_chunk_size):
+                if self.cancelled or self._timed_out:
+                    break
+
+                proc.stdin.write(text_content[start:start + _stream_chunk_size])
+
+            proc.stdin.close()
+        except (OSError, ValueError):
+            # NOTE: The command exited or was killed before reading all its input. Closing
+            # STDIN again discards the data left in its buffer.
+            try:
+                proc.stdin.close()
+            except (OSError, ValueError):
+                pass
+
+    def _read_stdout(self, proc):
+        # NOTE: Formatted outputs are usually about the size of their inputs.
+        output = bytearray(len(self.text_content))
+        size = 0
+
+        while True:
+            chunk = proc.stdout.read1(_stream_chunk_size)
+
+            if not chunk:
+                break
+
+            output[size:size + len(chunk)] = chunk
+            size += len(chunk)
+
+        del output[size:]
+
+        return output
+
     def run(self):
         """Run thread.
 
@@ -218,6 +1154,9 @@ class ThreadCall(threading.Thread):
             Missing command.
         """
         try:
+            if self.cancelled:
+                raise RuntimeError("Formatting cancelled.")
+
             if not self._cmd:
                 msg = "No command defined."
                 sublime.status_message(msg)
@@ -243,32 +1182,180 @@ class ThreadCall(threading.Thread):
                                      body=debug_msg, file_path=self._file_path, debug=True)
             logger.debug("%s\n%s\n%s" % (title, self._file_path, debug_msg))
 
-            with cmd_utils.popen(self._cmd,
-                                 logger=logger,
-                                 bufsize=160 * len(self.text_content),
-                                 cwd=self._cwd) as proc:
-                stdout, stderr = proc.communicate(self.text_content)
-
-                if stderr:
-                    self.formatted_content = False
-                    self.error = _error_template.format(
-                        cwd=self._cwd,
-                        cmd=" ".join(self._cmd),
-                        stderr=self.read_output(stderr)
-                    )
-                else:
-                    self.formatted_content = self.read_output(stdout)
+            cache_key = self._get_cache_key()
+            stdout = get_cache().get(cache_key) if cache_key else None
+
+            if stdout is None:
+                with get_workers():
+                    stdout, stderr = self.communicate()
+
+                if cache_key and not stderr:
+                    get_cache().set(cache_key, stdout)
+            else:
+                stderr = b""
+
+            if stderr:
+                self.formatted_content = False
+                self.error = _error_template.format(
+                    cwd=self._cwd,
+                    cmd=" ".join(self._cmd),
+                    stderr=self.read_output(stderr)
+                )
+            else:
+                self.formatted_content = self.read_output(stdout)
+
+                if self.region:
+                    self.formatted_content = re.sub(
+                        r"(\r|\r\n|\n)\Z", "", self.formatted_content)
+        except Exception as err:
+            self.formatted_content = False
+            self.error = _error_template.format(
+                cwd=self._cwd,
+                cmd=" ".join(self._cmd),
+                stderr=str(err)
+            )
+
+
+class BatchThreadCall(ThreadCall):
+    """Format several selections in a single command execution.
+
+    Attributes
+    ----------
+    threads : list
+        The threads of each selection. They aren't started, their formatted content is set
+        after splitting the formatted text.
+    split_failed : bool
+        Whether the formatted text couldn't be split.
+    """
+
+    def __init__(self, view, threads, cmd_settings={}):
+        """Initialization.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        threads : list
+            The threads of each selection.
+        cmd_settings : dict, optional
+            Command settings.
+        """
+        self.threads = sorted(threads, key=lambda t: t.region.begin())
+        self.split_failed = False
+        # NOTE: The sentinels are derived from the selections content so formatted outputs
+        # can be cached.
+        token = hashlib.sha1(b"\0".join(t.text_content for t in self.threads)).hexdigest()[:16]
+        self._sentinels = [cmd_settings["batch_sentinel"].replace("{id}", "%s%06d" % (token, i))
+                           for i in range(len(self.threads) - 1)]
+
+        text_content = ""
+
+        for thread, sentinel in zip(self.threads, self._sentinels + [""]):
+            text_content += self.read_output(thread.text_content)
+
+            if sentinel:
+                text_content += "\n%s\n" % sentinel
+
+        super().__init__(view, text_content, cmd_settings=cmd_settings)
+
+    def run(self):
+        """Run thread.
+        """
+        super().run()
+
+        if self.formatted_content is False:
+            return
+
+        pieces = []
+        remainder = self.formatted_content
+
+        for sentinel in self._sentinels:
+            if self.formatted_content.count(sentinel) != 1 or sentinel not in remainder:
+                self.split_failed = True
+                return
+
+            piece, remainder = remainder.split(sentinel, 1)
+            pieces.append(piece.rstrip())
+            # NOTE: Drop the line break inserted after the sentinel.
+            remainder = re.sub(r"\A[ \t]*(\r\n|\r|\n)?", "", remainder)
+
+        pieces.append(re.sub(r"(\r|\r\n|\n)\Z", "", remainder))
+
+        for thread, piece in zip(self.threads, pieces):
+            thread.formatted_content = piece
+
+
+class FormatterJob():
+    """Formatting of a view.
+
+    Only one job per view is active at a time. Starting a job cancels the job previously started
+    for the same view.
+
+    Attributes
+    ----------
+    cancelled : bool
+        Whether the job was cancelled.
+    change_count : int
+        Change count of the view when the job was created.
+    threads : list
+        The threads of the job.
+    view : sublime.View
+        A Sublime Text view.
+    """
+
+    def __init__(self, view):
+        """Initialization.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        """
+        self.view = view
+        self.change_count = view.change_count()
+        self.cancelled = False
+        self.threads = []
+
+    def start(self, threads):
+        """Start threads as the active job of the view.
+
+        Parameters
+        ----------
+        threads : list
+            List of threads.
+        """
+        previous = _jobs.get(self.view.id())
+
+        if previous is not None and previous is not self:
+            previous.cancel()
+
+        _jobs[self.view.id()] = self
+        self.threads = threads
+
+        for thread in threads:
+            thread.start()
+
+    def cancel(self):
+        """Cancel the job, killing the commands of its threads.
+        """
+        self.cancelled = True
 
-                    if self.region:
-                        self.formatted_content = re.sub(
-                            r"(\r|\r\n|\n)\Z", "", self.formatted_content)
-        except Exception as err:
-            self.formatted_content = False
-            self.error = _error_template.format(
-                cwd=self._cwd,
-                cmd=" ".join(self._cmd),
-                stderr=str(err)
-            )
+        for thread in self.threads:
+            thread.cancel()
+
+    def finish(self):
+        """Stop being the active job of the view.
+
+        Returns
+        -------
+        bool
+            Whether the formatted text can be applied to the view.
+        """
+        if _jobs.get(self.view.id()) is self:
+            del _jobs[self.view.id()]
+
+        return not self.cancelled and self.view.is_valid() and \
+            self.view.change_count() == self.change_count
 
 
 class OdyseusCodeFormatterCommand(sublime_plugin.TextCommand):
@@ -290,7 +1377,7 @@ class OdyseusCodeFormatterCommand(sublime_plugin.TextCommand):
         None
             Halt execution.
         """
-        cmd_settings = self._ody_get_cmd_settings(kwargs.get("cmd_id"))
+        cmd_settings = get_cmd_settings(self.view, kwargs.get("cmd_id"))
 
         if not cmd_settings:  # It might have "disabled" set to true.
             return
@@ -306,12 +1393,14 @@ class OdyseusCodeFormatterCommand(sublime_plugin.TextCommand):
 
         if kwargs.get("ignore_selection", False) or \
             len(self.view.sel()) == 1 and self.view.sel()[0].empty() and \
-                self._ody_format_whole_file_allowed(kwargs.get("cmd_id")):
+                format_whole_file_allowed(self.view, kwargs.get("cmd_id")):
             # Only one caret and no text selected, format the whole file
+            add_range_args(self.view, cmd_settings)
             text_content = self.view.substr(sublime.Region(0, self.view.size()))
             thread = ThreadCall(self.view, text_content, cmd_settings=cmd_settings)
-            thread.start()
-            self._ody_handle_thread(thread, lambda: self._ody_replace_file(
+            job = FormatterJob(self.view)
+            job.start([thread])
+            self._ody_handle_thread(job, thread, lambda: self._ody_replace_file(
                 thread, kwargs.get("save", False)))
         else:
             # Format each and every selection block
@@ -327,10 +1416,46 @@ class OdyseusCodeFormatterCommand(sublime_plugin.TextCommand):
                         region=selection,
                         cmd_settings=cmd_settings)
                     threads.append(thread)
-                    thread.start()
 
-            self._ody_handle_threads(threads, lambda process,
-                                     last_error: self._ody_replace_selections(process, last_error))
+            job = FormatterJob(self.view)
+
+            if len(threads) > 1 and cmd_settings.get("batch_sentinel"):
+                batch = BatchThreadCall(self.view, threads, cmd_settings=cmd_settings)
+                job.start([batch])
+                self._ody_handle_thread(job, batch, lambda: self._ody_replace_batch(job, batch))
+            else:
+                self._ody_start_threads(job, threads)
+
+    def _ody_start_threads(self, job, threads):
+        """Format each selection in its own thread.
+
+        Parameters
+        ----------
+        job : FormatterJob
+            The job the threads belong to.
+        threads : list
+            List of threads.
+        """
+        job.start(threads)
+        self._ody_handle_threads(job, threads, lambda process,
+                                 last_error: self._ody_replace_selections(process, last_error))
+
+    def _ody_replace_batch(self, job, batch):
+        """Replace the content of the selections formatted in a single command execution.
+
+        Parameters
+        ----------
+        job : FormatterJob
+            The job the thread belongs to.
+        batch : BatchThreadCall
+            Thread.
+        """
+        if batch.split_failed:
+            logger.debug("Sentinel comments were altered by the formatter. "
+                         "Formatting each selection separately.")
+            self._ody_start_threads(job, batch.threads)
+        else:
+            self._ody_replace_selections(batch.threads, None)
 
     def _ody_replace_file(self, thread, save=False):
         """Replace the entire file content with the formatted text.
@@ -400,154 +1525,560 @@ class OdyseusCodeFormatterCommand(sublime_plugin.TextCommand):
             else:
                 sublime.status_message("Nothing to format")
 
-    def _ody_handle_thread(self, thread, callback):
+    def _ody_finish_job(self, job):
+        """Finish a job.
+
+        Parameters
+        ----------
+        job : FormatterJob
+            The job.
+
+        Returns
+        -------
+        bool
+            Whether the formatted text can be applied to the view.
+        """
+        if job.finish():
+            return True
+
+        if not job.cancelled:
+            sublime.status_message("File modified while formatting. Formatting discarded.")
+
+        return False
+
+    def _ody_handle_thread(self, job, thread, callback):
         """Handle thread.
 
         Parameters
         ----------
+        job : FormatterJob
+            The job the thread belongs to.
         thread : ThreadCall
             Thread.
         callback : method
             Method to call if a thread execution was successful.
         """
-        if thread and thread.is_alive():
-            sublime.set_timeout(lambda: self._ody_handle_thread(thread, callback), 100)
-        elif thread and thread.formatted_content is not False:
-            callback()
-        else:
-            title = "%s Error:" % self.__class__.__name__
-            display_message_in_panel(self.view, title=title, body=thread.error)
+        def on_finished():
+            if not self._ody_finish_job(job):
+                return
+
+            if thread.formatted_content is not False:
+                callback()
+            else:
+                title = "%s Error:" % self.__class__.__name__
+                display_message_in_panel(self.view, title=title, body=thread.error)
+
+        on_threads_finished([thread], on_finished)
 
-    def _ody_handle_threads(self, threads, callback, process=False, last_error=None):
+    def _ody_handle_threads(self, job, threads, callback):
         """Handle threads.
 
         Parameters
         ----------
+        job : FormatterJob
+            The job the threads belong to.
         threads : list
             List of threads.
         callback : method
-            Method to call if a thread execution was successful.
-        process : bool, list, optional
-            List of successfully executed threads ready to process.
-        last_error : None, str, optional
-            Error message.
+            Method to call with the list of successfully executed threads and the last error
+            message once all threads finished.
         """
-        next_threads = []
-        if process is False:
+        def on_finished():
+            if not self._ody_finish_job(job):
+                return
+
             process = []
+            last_error = None
+
+            for thread in threads:
+                if thread.formatted_content is False:
+                    # This thread failed
+                    last_error = thread.error
+                    continue
+
+                # Thread completed correctly
+                process.append(thread)
 
-        for thread in threads:
-            if thread.is_alive():
-                next_threads.append(thread)
-                continue
-
-            if thread.formatted_content is False:
-                # This thread failed
-                last_error = thread.error
-                continue
-
-            # Thread completed correctly
-            process.append(thread)
-
-        if len(next_threads):
-            # Some more threads to wait
-            sublime.set_timeout(lambda: self._ody_handle_threads(
-                next_threads, callback, process, last_error), 100)
-        else:
             callback(process, last_error)
 
-    def _ody_cmd_get_defaults(self):
-        """Get default settings.
+        on_threads_finished(threads, on_finished)
+
+    def is_visible(self, **kwargs):
+        """Set command visibility.
+
+        Parameters
+        ----------
+        **kwargs
+            Keyword arguments.
 
         Returns
         -------
-        dict
-            Default settings.
+        bool
+            If the command should be visible.
         """
-        return {
-            "cmd": "",
-            "args": []
+        return is_cmd_visible(self.view, kwargs.get("cmd_id"))
+
+
+def reset_modified_lines(view):
+    """Forget the lines modified in a view.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    """
+    state = ModifiedLinesStorage.get(view)
+    state.rows = view.rowcol(view.size())[0]
+    # NOTE: The lines modified before the view was first seen are unknown.
+    state.valid = not view.is_dirty()
+    view.erase_regions(_modified_lines_key)
+
+
+def add_range_args(view, cmd_settings):
+    """Add the arguments defined in ``range_args`` for each range of modified lines.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    cmd_settings : dict
+        Command settings.
+    """
+    range_args = cmd_settings.get("range_args")
+
+    if not range_args or cmd_settings.get("pipeline") or view not in ModifiedLinesStorage or \
+            not ModifiedLinesStorage.get(view).valid:
+        return
+
+    args = []
+    offset = 0
+    position = 0
+
+    for region in view.get_regions(_modified_lines_key):
+        offset += len(view.substr(sublime.Region(position, region.begin())).encode("utf-8"))
+        position = region.begin()
+        placeholders = {
+            "{start_line}": view.rowcol(region.begin())[0] + 1,
+            "{end_line}": view.rowcol(region.end())[0] + 1,
+            "{offset}": offset,
+            "{length}": len(view.substr(region).encode("utf-8"))
         }
 
-    def _ody_get_cmd_settings(self, cmd_id):
-        """Set settings.
+        for arg in range_args:
+            for placeholder, value in placeholders.items():
+                arg = arg.replace(placeholder, str(value))
+
+            args.append(arg)
+
+    if args:
+        cmd_settings["args"] = cmd_settings.get("args", []) + args
+
+
+def get_format_on_save_cmd_settings(view):
+    """Get the settings of the command used to format a view when it's saved.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+
+    Returns
+    -------
+    None, dict
+        Command settings.
+    """
+    for cmd_id in settings.get("code_formatter_jobs.format_on_save", []):
+        if not is_cmd_visible(view, cmd_id) or not format_whole_file_allowed(view, cmd_id):
+            continue
+
+        cmd_settings = get_cmd_settings(view, cmd_id)
+
+        if cmd_settings and cmd_settings["cmd"]:
+            cmd_settings["cmd_id"] = cmd_id
+            return cmd_settings
+
+    return None
+
+
+def format_in_background(view, save_when_ready=False):
+    """Format a view in the background to apply the formatted text when the view is saved.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    save_when_ready : bool, optional
+        Whether to apply the formatted text and save the view as soon as it's ready.
+    """
+    if not view.is_valid():
+        return
+
+    state = FormatOnSaveStorage.get(view)
+    change_count = view.change_count()
+
+    if state.change_count == change_count:
+        # NOTE: Already formatted, being formatted or failed to be formatted.
+        if save_when_ready:
+            if state.thread is not None and state.thread.is_alive():
+                state.save_when_ready = True
+            elif state.formatted_content is not None:
+                apply_formatted_content(view, state, save=True)
+
+        return
+
+    cmd_settings = get_format_on_save_cmd_settings(view)
+
+    if cmd_settings is None:
+        return
+
+    # NOTE: The view was modified since the previous background formatting started. Kill it.
+    if state.thread is not None:
+        state.thread.cancel()
+
+    add_range_args(view, cmd_settings)
+    text_content = view.substr(sublime.Region(0, view.size()))
+    thread = ThreadCall(view, text_content, cmd_settings=cmd_settings)
+    state.change_count = change_count
+    state.thread = thread
+    state.formatted_content = None
+    state.save_when_ready = save_when_ready
+
+    def on_finished():
+        if state.thread is not thread:
+            return
+
+        state.thread = None
+
+        if not view.is_valid() or view.change_count() != change_count:
+            state.change_count = None
+            return
+
+        if thread.formatted_content is False:
+            logger.debug("Background formatting failed.\n%s" % thread.error)
+            return
+
+        if thread.text_content != thread.formatted_content.encode("utf-8"):
+            state.formatted_content = thread.formatted_content
+
+        if state.save_when_ready:
+            apply_formatted_content(view, state, save=True)
+
+    thread.start()
+    on_threads_finished([thread], on_finished)
+
+
+def apply_formatted_content(view, state, save=False):
+    """Apply the text formatted in the background to a view.
+
+    Parameters
+    ----------
+    view : sublime.View
+        A Sublime Text view.
+    state : FormatOnSaveStorageClass
+        The format on save state of the view.
+    save : bool, optional
+        Whether to save the view after applying the formatted text.
+    """
+    formatted_content = state.formatted_content
+    state.formatted_content = None
+    state.save_when_ready = False
+
+    if formatted_content is not None:
+        view.run_command("odyseus_update_content", {
+            "text": formatted_content
+        })
+
+    # NOTE: The view content is now formatted, so it doesn't need to be formatted again.
+    state.change_count = view.change_count()
+
+    if save and formatted_content is not None:
+        view.run_command("save")
+
+
+class OdyseusCodeFormatterFormatOnSaveListener(sublime_plugin.EventListener):
+    """Format files when they are saved.
+    """
+
+    def on_modified_async(self, view):
+        """Called after changes have been made to a view.
 
         Parameters
         ----------
-        cmd_id : str
-            Command ID.
-
-        Returns
-        -------
-        bool
-            Halt execution.
-        dict
-            Command definition of an existent command.
+        view : sublime.View
+            A Sublime Text view.
         """
-        if cmd_id is None or get_settings(cmd_id).get("disabled", False):
-            return False
+        if not settings.get("code_formatter_jobs.format_on_save", []) or \
+                view.settings().get("is_widget"):
+            return
 
-        settings_exec_map = utils.substitute_variables(
-            utils.get_view_context(self.view),
-            get_settings(cmd_id).get("exec_map", {}).get(sublime.platform(), [])
+        queue.debounce(
+            lambda: format_in_background(view),
+            delay=settings.get("code_formatter_jobs.format_on_save_delay", 1000),
+            key="code_formatter-format-on-save-%d" % view.id()
         )
 
-        for _map in settings_exec_map:
-            if "cmd" not in _map or not _map["cmd"]:
-                continue
+    def on_pre_save(self, view):
+        """Called just before a view is saved.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        """
+        if not settings.get("code_formatter_jobs.format_on_save", []):
+            return
 
-            # NOTE: The cmd_utils.can_exec is to not require the command to exist in PATH.
-            # Let's see how it goes.
-            if cmd_utils.can_exec(_map["cmd"]) or cmd_utils.which(_map["cmd"]):
-                return misc_utils.merge_dict(self._ody_cmd_get_defaults(), _map)
+        state = FormatOnSaveStorage.get(view)
 
-        return False
+        if state.change_count != view.change_count() or \
+                (state.thread is not None and state.thread.is_alive()):
+            state.format_after_save = True
+        elif state.formatted_content is not None:
+            apply_formatted_content(view, state)
 
-    def _ody_format_whole_file_allowed(self, cmd_id):
-        """Format whole file allowed.
+    def on_post_save(self, view):
+        """Called after a view has been saved.
 
         Parameters
         ----------
-        cmd_id : str, optional
-            Command ID.
+        view : sublime.View
+            A Sublime Text view.
+        """
+        if view not in FormatOnSaveStorage:
+            return
 
-        Returns
-        -------
-        bool
-            If it is allowed to format the whole content of a file.
+        state = FormatOnSaveStorage.get(view)
+
+        if state.format_after_save:
+            state.format_after_save = False
+            format_in_background(view, save_when_ready=True)
+
+    def on_close(self, view):
+        """Called when a view is closed.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
         """
-        whole_file_not_allowed = get_settings(cmd_id).get("whole_file_not_allowed", False)
+        if view in FormatOnSaveStorage:
+            state = FormatOnSaveStorage.get(view)
+
+            if state.thread is not None:
+                state.thread.cancel()
+
+        FormatOnSaveStorage.pop(view)
+
 
-        if isinstance(whole_file_not_allowed, bool):
-            return not whole_file_not_allowed
+def split_lines(text):
+    """Split a text into lines keeping their line breaks.
+
+    Parameters
+    ----------
+    text : str
+        Text to split.
+
+    Returns
+    -------
+    list
+        The lines. Joining them results in the original text.
+    """
+    lines = text.split("\n")
+
+    for i in range(len(lines) - 1):
+        lines[i] += "\n"
+
+    return lines
+
+
+def longest_increasing_subsequence(matches):
+    """Get the longest subsequence of matches increasing in both sequences.
+
+    Parameters
+    ----------
+    matches : list
+        List of (a_index, b_index) tuples sorted by a_index.
+
+    Returns
+    -------
+    list
+        The subsequence.
+    """
+    tails = []
+    tails_b = []
+    previous = {}
+
+    for match in matches:
+        i = bisect.bisect_left(tails_b, match[1])
+        previous[match] = tails[i - 1] if i else None
+
+        if i == len(tails):
+            tails.append(match)
+            tails_b.append(match[1])
         else:
-            return not utils.has_right_syntax(
-                self.view, view_syntaxes=whole_file_not_allowed)
+            tails[i] = match
+            tails_b[i] = match[1]
 
-    def is_visible(self, **kwargs):
-        """Set command visibility.
+    subsequence = []
+    match = tails[-1] if tails else None
+
+    while match is not None:
+        subsequence.append(match)
+        match = previous[match]
+
+    subsequence.reverse()
+
+    return subsequence
+
+
+def diff_lines(a, b):
+    """Get the hunks that transform a list of lines into another using patience diff.
+
+    Parameters
+    ----------
+    a : list
+        Original lines.
+    b : list
+        Modified lines.
+
+    Returns
+    -------
+    None, list
+        List of (a_start, a_end, b_start, b_end) tuples sorted by position. None if computing or
+        applying the hunks is more expensive than replacing all lines.
+    """
+    # NOTE: Lines are interned into integers so they are hashed and compared only once.
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a]
+    b = [ids.setdefault(line, len(ids)) for line in b]
+    hunks = []
+    ranges = [(0, len(a), 0, len(b))]
+
+    while ranges:
+        a_lo, a_hi, b_lo, b_hi = ranges.pop()
+
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            a_lo += 1
+            b_lo += 1
+
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+
+        if a_lo == a_hi and b_lo == b_hi:
+            continue
+
+        if a_lo == a_hi or b_lo == b_hi:
+            hunks.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+
+        if (a_hi - a_lo) + (b_hi - b_lo) > _diff_max_lines:
+            return None
+
+        # NOTE: Lines that are unique in both ranges are used as anchors.
+        occurrences = {}
+
+        for i in range(a_lo, a_hi):
+            occurrences[a[i]] = (occurrences[a[i]][0] + 1, i, 0, None) \
+                if a[i] in occurrences else (1, i, 0, None)
+
+        for i in range(b_lo, b_hi):
+            if b[i] in occurrences:
+                count_a, index_a, count_b, _ = occurrences[b[i]]
+                occurrences[b[i]] = (count_a, index_a, count_b + 1, i)
+
+        anchors = longest_increasing_subsequence(sorted(
+            (index_a, index_b) for count_a, index_a, count_b, index_b in occurrences.values()
+            if count_a == 1 and count_b == 1
+        ))
+
+        if not anchors:
+            hunks.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+
+        for index_a, index_b in anchors:
+            ranges.append((a_lo, index_a, b_lo, index_b))
+            a_lo, b_lo = index_a + 1, index_b + 1
+
+        ranges.append((a_lo, a_hi, b_lo, b_hi))
+
+        if len(hunks) > _diff_max_hunks:
+            return None
+
+    if len(hunks) > _diff_max_hunks:
+        return None
+
+    return sorted(hunks)
+
+
+class OdyseusCodeFormatterModifiedLinesListener(sublime_plugin.EventListener):
+    """Keep track of the lines modified since a file was last saved.
+
+    Views are only tracked if a command definition uses the ``range_args`` option.
+    """
+
+    def on_activated(self, view):
+        """Called when a view gains input focus.
 
         Parameters
         ----------
-        **kwargs
-            Keyword arguments.
+        view : sublime.View
+            A Sublime Text view.
+        """
+        if view not in ModifiedLinesStorage and not view.settings().get("is_widget") and \
+                range_args_used():
+            reset_modified_lines(view)
 
-        Returns
-        -------
-        bool
-            If the command should be visible.
+    def on_modified(self, view):
+        """Called after changes have been made to a view.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
         """
-        cmd_settings = self._ody_get_cmd_settings(kwargs.get("cmd_id"))
+        if view in ModifiedLinesStorage:
+            # NOTE: Formatted lines are kept marked as modified. Their regions are updated by
+            # Sublime Text.
+            mark_modified_lines(view, _modified_lines_key, ModifiedLinesStorage.get(view),
+                                ignored_commands={"odyseus_update_content"})
 
-        if not cmd_settings:  # It might have "disabled" set to true.
-            return False
+    def on_text_command(self, view, command_name, args):
+        """Called when a text command is issued.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        command_name : str
+            The command name.
+        args : dict
+            The command arguments.
+        """
+        if command_name in history_commands and view in ModifiedLinesStorage:
+            ModifiedLinesStorage.get(view).valid = False
+            view.erase_regions(_modified_lines_key)
 
-        is_visible = get_settings(kwargs.get("cmd_id")).get("is_visible", True)
+    def on_post_save(self, view):
+        """Called after a view has been saved.
 
-        if isinstance(is_visible, bool):
-            return is_visible
-        else:
-            return utils.has_right_syntax(self.view, view_syntaxes=is_visible)
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        """
+        if view in ModifiedLinesStorage:
+            reset_modified_lines(view)
+
+    def on_close(self, view):
+        """Called when a view is closed.
+
+        Parameters
+        ----------
+        view : sublime.View
+            A Sublime Text view.
+        """
+        ModifiedLinesStorage.pop(view)
 
 
 class OdyseusUpdateContentCommand(sublime_plugin.TextCommand):
@@ -575,6 +2106,9 @@ class OdyseusUpdateContentCommand(sublime_plugin.TextCommand):
     def _ody_replace_whole_view(self, edit, text):
         """Replace whole view.
 
+        Only the modified lines are replaced. If there are too many modifications, the whole
+        view content is replaced.
+
         Parameters
         ----------
         edit : sublime.Edit
@@ -589,11 +2123,49 @@ class OdyseusUpdateContentCommand(sublime_plugin.TextCommand):
         if settings.get("ensure_newline_at_eof_on_save") and not text.endswith("\n"):
             text = text + "\n"
 
-        _, err = merge_utils.merge_code(self.view, edit, code, text)
+        code_lines = split_lines(code)
+        text_lines = split_lines(text)
+        hunks = diff_lines(code_lines, text_lines)
+
+        if hunks is None:
+            self._ody_replace_all(edit, region, text)
+            return
+
+        offsets = [0]
+
+        for line in code_lines:
+            offsets.append(offsets[-1] + len(line))
+
+        # NOTE: Replace from bottom to top so the offsets of the remaining hunks stay valid.
+        for a_start, a_end, b_start, b_end in reversed(hunks):
+            self.view.replace(edit, sublime.Region(offsets[a_start], offsets[a_end]),
+                              "".join(text_lines[b_start:b_end]))
+
+    def _ody_replace_all(self, edit, region, text):
+        """Replace the whole view content keeping the selections in the same rows and columns.
+
+        Parameters
+        ----------
+        edit : sublime.Edit
+            sublime.Edit object.
+        region : sublime.Region
+            Region of the whole view content.
+        text : str
+            Text to replace view content with.
+        """
+        selections = [(self.view.rowcol(sel.a), self.view.rowcol(sel.b))
+                      for sel in self.view.sel()]
+        self.view.replace(edit, region, text)
+        self.view.sel().clear()
+
+        for rowcol_a, rowcol_b in selections:
+            self.view.sel().add(sublime.Region(self._ody_text_point(*rowcol_a),
+                                               self._ody_text_point(*rowcol_b)))
+
+    def _ody_text_point(self, row, col):
+        point = self.view.text_point(row, 0)
 
-        if err:
-            title = "# %s Error: Merge failure:" % self.__class__.__name__
-            display_message_in_panel(self.view, title=title, body=err)
+        return min(point + col, self.view.line(point).end())
 
 
 if __name__ == "__main__":
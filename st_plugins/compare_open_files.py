@@ -30,6 +30,7 @@ import sublime
 import sublime_plugin
 
 from . import display_message_in_panel
+from . import get_executable_from_settings
 from . import settings
 from python_utils import cmd_utils
 from python_utils.sublime_text_utils import utils
@@ -106,8 +107,8 @@ def run_comparison(three_way_comparison, cls_name):
     three_way_comparison : bool
         Whether to compare three files or just two.
     """
-    diff_exec = utils.get_executable_from_settings(
-        None, get_settings("exec_map").get(sublime.platform(), []))
+    diff_exec = get_executable_from_settings(
+        "compare_open_files", None, get_settings("exec_map").get(sublime.platform(), []))
 
     selected_files_error_msg = _selected_files_base_error_msg.format(
         number="THREE" if three_way_comparison else "TWO"
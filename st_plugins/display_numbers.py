@@ -33,9 +33,9 @@ from functools import partial
 import sublime
 import sublime_plugin
 
+from . import AdaptiveScheduler
 from . import settings
 from . import settings_utils
-from python_utils.sublime_text_utils import queue
 
 __all__ = [
     "OdyseusDnDisplayNumberListener",
@@ -58,6 +58,8 @@ space = "&nbsp;"
 temp_small_space = "*"
 small_space = "<span>" + space + "</span>"
 
+Scheduler = AdaptiveScheduler(_plugin_id.format("debounce"))
+
 _popup_html = """
 <body id="display-numbers-popup">
 <style>
@@ -237,11 +239,8 @@ class OdyseusDnDisplayNumberListener(sublime_plugin.EventListener):
             view and len(view.sel())
 
         if double_click:
-            queue.debounce(
-                partial(view.run_command, "odyseus_dn_show_numbers_popup"),
-                delay=100,
-                key=_plugin_id.format("debounce")
-            )
+            Scheduler.schedule(view, partial(view.run_command, "odyseus_dn_show_numbers_popup"),
+                               delay=100)
 
 
 class OdyseusDnShowNumbersPopupCommand(sublime_plugin.TextCommand):
@@ -102,6 +102,7 @@ import sublime
 import sublime_plugin
 
 from . import display_message_in_panel
+from . import get_executable_from_settings
 from . import logger
 from . import settings
 from python_utils import cmd_utils
@@ -343,8 +344,8 @@ def open_zeal(view, lang, text, join_command=False):
     join_command : bool, optional
         Description
     """
-    zeal_exec = utils.get_executable_from_settings(
-        view, get_settings("exec_map").get(sublime.platform(), []))
+    zeal_exec = get_executable_from_settings(
+        "search_with_zeal", view, get_settings("exec_map").get(sublime.platform(), []))
 
     if zeal_exec:
         try:
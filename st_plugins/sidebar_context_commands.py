@@ -140,7 +140,9 @@ import sublime
 import sublime_plugin
 
 from . import display_message_in_panel
+from . import executables
 from . import logger
+from . import on_threads_finished
 from . import plugin_name
 from . import settings
 from python_utils import cmd_utils
@@ -310,9 +312,6 @@ class OdyseusExecCommandOnSidebarSelectionCommand(sublime_plugin.WindowCommand):
                         thread = ThreadCall(cmd=cmd + arguments, cwd=working_directory)
                         threads.append(thread)
                         thread.start()
-
-                        self._ody_handle_threads(threads, lambda process,
-                                                 last_error: self._ody_handle_output(process, last_error))
                     else:
                         proc = Process(target=self._ody_proc_exec, args=(cmd + arguments,), kwargs={
                             "cmd_id": str(cmd_id),
@@ -326,9 +325,6 @@ class OdyseusExecCommandOnSidebarSelectionCommand(sublime_plugin.WindowCommand):
                     thread = ThreadCall(cmd=command, cwd=working_directory)
                     threads.append(thread)
                     thread.start()
-
-                    self._ody_handle_threads(threads, lambda process,
-                                             last_error: self._ody_handle_output(process, last_error))
                 else:
                     proc = Process(target=self._ody_proc_exec, args=(command,), kwargs={
                         "cmd_id": str(cmd_id),
@@ -337,10 +333,14 @@ class OdyseusExecCommandOnSidebarSelectionCommand(sublime_plugin.WindowCommand):
                     })
 
                     proc.start()
+
+            if threads:
+                self._ody_handle_threads(threads, lambda process,
+                                         last_error: self._ody_handle_output(process, last_error))
         else:
             sublime.status_message("No valid path/s selected.")
 
-    def _ody_handle_threads(self, threads, callback, process=False, last_error=None):
+    def _ody_handle_threads(self, threads, callback):
         """Handle threads.
 
         Parameters
@@ -348,36 +348,26 @@ class OdyseusExecCommandOnSidebarSelectionCommand(sublime_plugin.WindowCommand):
         threads : list
             List of threads.
         callback : method
-            Method to call if a thread execution was successful.
-        process : bool, list, optional
-            List of successfully executed threads ready to process.
-        last_error : None, str, optional
-            Error message.
+            Method to call with the list of successfully executed threads and the last error
+            message once all threads finished.
         """
-        next_threads = []
-        if process is False:
+        def on_finished():
             process = []
+            last_error = None
 
-        for thread in threads:
-            if thread.is_alive():
-                next_threads.append(thread)
-                continue
-
-            if thread.command_output is None:
-                # This thread failed
-                last_error = thread.error
-                continue
+            for thread in threads:
+                if thread.command_output is None:
+                    # This thread failed
+                    last_error = thread.error
+                    continue
 
-            # Thread completed correctly
-            process.append(thread)
+                # Thread completed correctly
+                process.append(thread)
 
-        if len(next_threads):
-            # Some more threads to wait
-            sublime.set_timeout(lambda: self._ody_handle_threads(
-                next_threads, callback, process, last_error), 100)
-        else:
             callback(process, last_error)
 
+        on_threads_finished(threads, on_finished)
+
     def _ody_handle_output(self, threads, last_error):
         """Replace the content of a list of selections.
 
@@ -504,7 +494,7 @@ class OdyseusExecCommandOnSidebarSelectionCommand(sublime_plugin.WindowCommand):
             cmd = utils.substitute_variables(
                 utils.get_view_context(None), _map["cmd"])
 
-            if cmd_utils.can_exec(cmd) or cmd_utils.which(cmd):
+            if executables.resolve(cmd_id, cmd):
                 return misc_utils.merge_dict(self._ody_get_defaults(), _map)
 
         return False
@@ -7,18 +7,28 @@ See README.md for details.
 @license: MIT (http://www.opensource.org/licenses/mit-license.php)
 @since: 2011-02-25
 """
+import bisect
+import itertools
+import re
+
 from functools import partial
 
 import sublime
 import sublime_plugin
 
+from . import AdaptiveScheduler
+from . import history_commands
+from . import logger
+from . import mark_modified_lines
 from . import settings
 from . import settings_utils
+from . import ViewsStorage
 from python_utils.sublime_text_utils import events
-from python_utils.sublime_text_utils import queue
+from python_utils.sublime_text_utils import merge_utils
 
 __all__ = [
     "OdyseusTsDeleteTrailingSpacesCommand",
+    "OdyseusTsDeleteTrailingSpacesInAllViewsCommand",
     "OdyseusTsHighlightTrailingSpacesCommand",
     "OdyseusTsToggleLiveHighlightCommand",
     "OdyseusTsTrailingSpacesListener",
@@ -26,13 +36,82 @@ __all__ = [
 
 _plugin_id = "TrailingSpaces-{}"
 
+# NOTE: Above this number of regions, ignored scopes are found once instead of checking each region.
+_match_selector_max_regions = 16
+
 
 class StorageClass():
+    """Trailing spaces state of a view.
+
+    The matched regions and the lines modified since the last pass are stored as hidden regions
+    in the view itself so Sublime Text keeps their positions in sync with the edits.
+
+    Attributes
+    ----------
+    ignored_regions : None, tuple
+        The change count of the view and the regions of the view inside ignored scopes.
+    prev_highlightable : None, list
+        The last highlighted regions.
+    rows : int
+        Number of rows the view had the last time it was modified.
+    scan_chunks : int
+        Number of chunks scanned by the last scan in chunks of the view.
+    scan_id : int
+        The ID of the last scan in chunks of the view.
+    valid : bool
+        Whether the stored regions can be incrementally updated. If not, a full scan is needed.
+    """
+
     def __init__(self):
+        self.ignored_regions = None
         self.prev_highlightable = None
+        self.rows = None
+        self.scan_chunks = 0
+        self.scan_id = 0
+        self.valid = False
+
+
+class SettingsSnapshot():
+    """Snapshot of this plugin settings.
+
+    It's rebuilt only when the settings change so the event listeners don't have to read
+    settings nor build regular expressions and selectors.
+    """
+
+    def __init__(self):
+        self.live_highlight = get_settings("live_highlight", True)
+        self.highlight_delay = get_settings("highlight_delay", 0)
+        self.highlight_color = get_settings("highlight_color", "invalid.illegal") or ""
+        self.include_current_line = get_settings("include_current_line", False)
+        self.file_max_size = get_settings("file_max_size", 10485760)
+        self.large_file_scan_chunk_size = get_settings("large_file_scan_chunk_size", 262144)
+        self.large_file_scan_margin = get_settings("large_file_scan_margin", 20000)
+        self.syntax_ignore = [s.lower() for s in get_settings("syntax_ignore", [])]
+        self.ignored_scopes = "|".join(get_settings("scope_ignore", []))
+        self.regexp = get_regexp()
+        self.pattern = compile_regexp(self.regexp)
+        self.large_file_scan = get_settings("large_file_scan", True) and self.pattern is not None
+
+
+Storage = ViewsStorage(StorageClass)
+Settings = None
+Scheduler = AdaptiveScheduler(_plugin_id.format("debounce"))
+
+
+def get_snapshot():
+    """Get this plugin settings snapshot.
+
+    Returns
+    -------
+    SettingsSnapshot
+        This plugin settings snapshot.
+    """
+    global Settings
 
+    if Settings is None:
+        Settings = SettingsSnapshot()
 
-Storage = StorageClass()
+    return Settings
 
 
 @events.on("plugin_loaded")
@@ -40,7 +119,19 @@ def on_plugin_loaded():
     """On plugin loaded.
     """
     global Storage
-    Storage = StorageClass()
+    global Settings
+    Storage = ViewsStorage(StorageClass)
+    Settings = None
+
+
+@events.on("settings_changed")
+def on_settings_changed(settings, **kwargs):
+    global Settings
+    Settings = SettingsSnapshot()
+
+    for state in Storage.values():
+        state.ignored_regions = None
+        state.valid = False
 
 
 def get_settings(s, default={}):
@@ -61,6 +152,126 @@ def get_settings(s, default={}):
     return settings.get("trailing_spaces.%s" % s, default)
 
 
+def get_regexp():
+    """Get the regular expression used to find trailing spaces.
+
+    Returns
+    -------
+    str
+        Regular expression.
+    """
+    regexp = get_settings("regexp") + "$"
+
+    if get_settings("include_empty_lines", True):
+        return regexp
+
+    return r"(?<=\S)%s$" % regexp
+
+
+def compile_regexp(regexp):
+    """Compile a regular expression used by Sublime Text to be used by Python.
+
+    Parameters
+    ----------
+    regexp : str
+        Regular expression.
+
+    Returns
+    -------
+    None, re.Pattern
+        The compiled regular expression or None if it couldn't be compiled.
+    """
+    try:
+        return re.compile(regexp, re.MULTILINE)
+    except re.error:
+        # NOTE: Sublime Text's regular expressions engine supports syntax that Python's doesn't.
+        # Views will always be fully scanned when using such expressions.
+        return None
+
+
+def filter_ignored_scopes(view, regions):
+    """Filter out regions that are inside ignored scopes.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    regions : list
+        List of regions.
+
+    Returns
+    -------
+    list
+        The filtered list of regions.
+    """
+    ignored_scopes = get_snapshot().ignored_scopes
+
+    if not ignored_scopes or not regions:
+        return regions
+
+    # NOTE: Checking a few regions one by one is cheaper than finding all ignored scopes.
+    if len(regions) <= _match_selector_max_regions:
+        return [region for region in regions
+                if not view.match_selector(region.begin(), ignored_scopes)]
+
+    ignored_regions = find_ignored_regions(view)
+    ignored_begins = [region.begin() for region in ignored_regions]
+
+    def is_ignored(point):
+        i = bisect.bisect_right(ignored_begins, point) - 1
+        return i >= 0 and point < ignored_regions[i].end()
+
+    return [region for region in regions if not is_ignored(region.begin())]
+
+
+def find_ignored_regions(view):
+    """Find the regions of a view that are inside ignored scopes.
+
+    The regions are cached until the view is modified.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+
+    Returns
+    -------
+    list
+        Sorted list of regions.
+    """
+    state = Storage.get(view)
+    change_count = view.change_count()
+
+    if state.ignored_regions is None or state.ignored_regions[0] != change_count:
+        state.ignored_regions = (change_count, sorted(
+            view.find_by_selector(get_snapshot().ignored_scopes), key=lambda r: r.begin()))
+
+    return state.ignored_regions[1]
+
+
+def get_highlightable(view, regions):
+    """Get the regions which are to be highlighted.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    regions : list
+        Regions qualified as trailing spaces.
+
+    Returns
+    -------
+    list
+        Regions to highlight.
+    """
+    if get_snapshot().include_current_line:
+        return regions
+
+    line = view.line(view.sel()[0].b)
+
+    return [region for region in regions if not line.contains(region)]
+
+
 def find_trailing_spaces(view):
     """Get the regions matching trailing spaces.
 
@@ -78,40 +289,293 @@ def find_trailing_spaces(view):
     if not view or len(view.sel()) == 0:
         return [None, None]
 
-    include_empty_lines = get_settings("include_empty_lines", True)
-    include_current_line = get_settings("include_current_line", False)
-    ignored_scopes = "|".join(get_settings("scope_ignore", []))
-    regexp = get_settings("regexp") + "$"
-    no_empty_lines_regexp = r"(?<=\S)%s$" % regexp
+    trailing_regions = filter_ignored_scopes(view, view.find_all(get_snapshot().regexp))
+
+    return [trailing_regions, get_highlightable(view, trailing_regions)]
+
+
+def find_trailing_spaces_in_region(view, region, pattern):
+    """Get the regions matching trailing spaces inside a region.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    region : sublime.Region
+        A region. It's expanded to include full lines.
+    pattern : re.Pattern
+        Compiled regular expression.
+
+    Returns
+    -------
+    list
+        The list of regions which map to trailing spaces.
+    """
+    region = view.line(region)
+    begin = region.begin()
+    regions = [sublime.Region(begin + match.start(), begin + match.end())
+               for match in pattern.finditer(view.substr(region))
+               if match.end() > match.start()]
+
+    return filter_ignored_scopes(view, regions)
+
+
+def replace_indexed_regions(view, region, regions):
+    """Replace the indexed trailing spaces regions that are inside a region.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    region : sublime.Region
+        The region whose indexed regions will be replaced.
+    regions : list
+        The regions found inside ``region``.
+
+    Returns
+    -------
+    list
+        The updated list of regions which map to trailing spaces.
+    """
+    indexed = [r for r in view.get_regions(_plugin_id.format("index"))
+               if not region.contains(r.begin())]
+    indexed.extend(regions)
+    indexed.sort(key=lambda r: r.begin())
+    view.add_regions(_plugin_id.format("index"), indexed, "", "", sublime.HIDDEN)
+
+    return indexed
+
+
+def scan_view_in_chunks(view, pattern):
+    """Scan a view for trailing spaces in chunks.
+
+    The visible region (plus a margin) is scanned immediately. The rest of the view is scanned
+    in chunks in the background, yielding between each chunk. The regions found in each chunk
+    are stored separately and they are merged into the index once the scan finishes.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    pattern : re.Pattern
+        Compiled regular expression.
+
+    Returns
+    -------
+    list
+        The list of regions which map to trailing spaces found in the visible region.
+    """
+    state = Storage.get(view)
+    state.scan_id += 1
+    erase_scan_chunks(view)
+    margin = get_snapshot().large_file_scan_margin
+    visible_region = view.visible_region()
+    region = view.line(sublime.Region(max(visible_region.begin() - margin, 0),
+                                      min(visible_region.end() + margin, view.size())))
+    regions = find_trailing_spaces_in_region(view, region, pattern)
+
+    view.add_regions(_plugin_id.format("index"), regions, "", "", sublime.HIDDEN)
+    # NOTE: The position of the next chunk is stored as a region so Sublime Text keeps it in
+    # sync with the edits made while scanning.
+    view.add_regions(_plugin_id.format("scan-cursor"), [sublime.Region(0, 0)], "", "",
+                     sublime.HIDDEN)
+    sublime.set_timeout_async(partial(scan_next_chunk, view, pattern, state.scan_id), 0)
+
+    return regions
+
+
+def scan_next_chunk(view, pattern, scan_id):
+    """Scan the next chunk of a view scanned in chunks.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    pattern : re.Pattern
+        Compiled regular expression.
+    scan_id : int
+        The ID of the scan. If the view was scanned again since this scan started, the scan stops.
+    """
+    if not view.is_valid() or view not in Storage:
+        return
+
+    state = Storage.get(view)
+    cursor = view.get_regions(_plugin_id.format("scan-cursor"))
+
+    if state.scan_id != scan_id or not cursor:
+        return
+
+    begin = cursor[0].begin()
+    size = view.size()
+
+    if begin >= size:
+        finish_scan(view)
+        return
+
+    change_count = view.change_count()
+    region = view.line(sublime.Region(
+        begin, min(begin + get_snapshot().large_file_scan_chunk_size, size)))
+    regions = find_trailing_spaces_in_region(view, region, pattern)
+
+    # NOTE: If the view was modified while scanning the chunk, the found regions might be off.
+    # Scan the same chunk again.
+    if change_count != view.change_count():
+        sublime.set_timeout_async(partial(scan_next_chunk, view, pattern, scan_id), 0)
+        return
+
+    view.add_regions(_plugin_id.format("scan-chunk-%d" % state.scan_chunks), regions, "", "",
+                     sublime.HIDDEN)
+    state.scan_chunks += 1
+    view.add_regions(_plugin_id.format("scan-cursor"), [sublime.Region(region.end() + 1)], "", "",
+                     sublime.HIDDEN)
+
+    # NOTE: While scanning, the index only holds the regions around the viewport. It's only
+    # updated (and repainted) when a chunk overlaps the viewport.
+    if region.intersects(view.visible_region()):
+        highlight_trailing_spaces_regions(
+            view, get_highlightable(view, replace_indexed_regions(view, region, regions)))
+
+    sublime.set_timeout_async(partial(scan_next_chunk, view, pattern, scan_id), 0)
+
+
+def finish_scan(view):
+    """Merge the regions found by a scan in chunks into the index of a view and repaint them.
+
+    Lines modified while scanning are scanned again.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    """
+    regions = []
 
-    sel = view.sel()[0]
-    line = view.line(sel.b)
+    for i in range(Storage.get(view).scan_chunks):
+        regions.extend(view.get_regions(_plugin_id.format("scan-chunk-%d" % i)))
 
-    # trailing_regions = view.find_all(regexp if include_empty_lines else no_empty_lines_regexp)
+    dirty = view.get_regions(_plugin_id.format("dirty-lines"))
+    dirty.extend(view.get_regions(_plugin_id.format("scan-dirty-lines")))
 
-    # filter out ignored scopes
-    trailing_regions = [
-        region for region in view.find_all(regexp if include_empty_lines else no_empty_lines_regexp)
-        if not ignored_scopes or not view.match_selector(region.begin(), ignored_scopes)
-    ]
+    erase_scan_chunks(view)
+    view.erase_regions(_plugin_id.format("scan-cursor"))
+    view.add_regions(_plugin_id.format("index"), regions, "", "", sublime.HIDDEN)
+    view.add_regions(_plugin_id.format("dirty-lines"), dirty, "", "", sublime.HIDDEN)
+    match_trailing_spaces(view)
 
-    if include_current_line:
-        return [trailing_regions, trailing_regions]
+
+def erase_scan_chunks(view):
+    """Erase the regions stored by a scan in chunks.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    """
+    state = Storage.get(view)
+
+    for i in range(state.scan_chunks):
+        view.erase_regions(_plugin_id.format("scan-chunk-%d" % i))
+
+    state.scan_chunks = 0
+    view.erase_regions(_plugin_id.format("scan-dirty-lines"))
+
+
+def is_scanning(view):
+    """Check if a view is being scanned in chunks.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+
+    Returns
+    -------
+    bool
+        Whether the view is being scanned.
+    """
+    return bool(view.get_regions(_plugin_id.format("scan-cursor")))
+
+
+def update_trailing_spaces_index(view):
+    """Update the trailing spaces index of a view.
+
+    Only the lines modified since the last pass are scanned. The whole view is scanned if the
+    index of the view was invalidated.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+
+    Returns
+    -------
+    list
+        The list of regions which map to trailing spaces.
+    """
+    state = Storage.get(view)
+    regexp = get_snapshot().regexp
+    pattern = get_snapshot().pattern
+    change_count = view.change_count()
+    dirty = view.get_regions(_plugin_id.format("dirty-lines"))
+
+    if dirty:
+        view.erase_regions(_plugin_id.format("dirty-lines"))
+
+        # NOTE: Chunks already scanned are fixed when the scan finishes.
+        if is_scanning(view):
+            view.add_regions(_plugin_id.format("scan-dirty-lines"),
+                             view.get_regions(_plugin_id.format("scan-dirty-lines")) + dirty,
+                             "", "", sublime.HIDDEN)
+
+    if not state.valid or pattern is None:
+        # NOTE: Validate the index before scanning so edits made during the scan are marked.
+        state.valid = True
+        state.rows = view.rowcol(view.size())[0]
+
+        if pattern is not None and max_size_exceeded(view):
+            return scan_view_in_chunks(view, pattern)
+
+        regions = filter_ignored_scopes(view, view.find_all(regexp))
+    elif dirty:
+        dirty_lines = []
+
+        for region in sorted(dirty, key=lambda r: r.begin()):
+            region = view.line(region)
+
+            if dirty_lines and dirty_lines[-1].end() >= region.begin():
+                dirty_lines[-1] = dirty_lines[-1].cover(region)
+            else:
+                dirty_lines.append(region)
+
+        dirty_begins = [line.begin() for line in dirty_lines]
+
+        def is_dirty(region):
+            i = bisect.bisect_right(dirty_begins, region.begin()) - 1
+            return i >= 0 and dirty_lines[i].end() >= region.begin()
+
+        regions = [region for region in view.get_regions(_plugin_id.format("index"))
+                   if not region.empty() and not is_dirty(region)]
+
+        for block in dirty_lines:
+            regions.extend(find_trailing_spaces_in_region(view, block, pattern))
+
+        regions.sort(key=lambda r: r.begin())
     else:
-        current_offender = view.find(
-            regexp if include_empty_lines else no_empty_lines_regexp, line.a)
-        removal = False if current_offender is None else line.intersects(current_offender)
-        highlightable = [i for i in trailing_regions if i !=
-                         current_offender] if removal else trailing_regions
-        return [trailing_regions, highlightable]
+        return view.get_regions(_plugin_id.format("index"))
+
+    # NOTE: If the view was modified while scanning, the found regions might be off.
+    state.valid = pattern is not None and change_count == view.change_count()
+    view.add_regions(_plugin_id.format("index"), regions, "", "", sublime.HIDDEN)
+
+    return regions
 
 
 def match_trailing_spaces(view):
     """Find the trailing spaces in the view and flags them as such.
 
     It will refresh highlighted regions as well. Does not execute if the
-    document's size exceeds the file_max_size setting, or if the fired in a view
-    which is not a legacy document (helper/build views and so on).
+    document's size exceeds the file_max_size setting and it can't be scanned in chunks,
+    or if the fired in a view which is not a legacy document (helper/build views and so on).
 
     Parameters
     ----------
@@ -128,16 +592,16 @@ def match_trailing_spaces(view):
         return
 
     # Silently pass if file is too big.
-    if max_size_exceeded(view):
+    if max_size_exceeded(view) and not large_file_scan_allowed():
         sublime.status_message("File is too big, trailing spaces handling disabled.")
         return
 
-    (matched, highlightable) = find_trailing_spaces(view)
-
-    if matched is None or highlightable is None:
+    if not view or len(view.sel()) == 0:
         return
 
-    highlight_trailing_spaces_regions(view, highlightable)
+    matched = update_trailing_spaces_index(view)
+
+    highlight_trailing_spaces_regions(view, get_highlightable(view, matched))
 
 
 def ignore_view(view):
@@ -162,8 +626,8 @@ def ignore_view(view):
     if not view_syntax:
         return False
 
-    for syntax_ignore in get_settings("syntax_ignore", []):
-        if syntax_ignore.lower() in view_syntax:
+    for syntax_ignore in get_snapshot().syntax_ignore:
+        if syntax_ignore in view_syntax:
             return True
 
     return False
@@ -182,7 +646,18 @@ def max_size_exceeded(view):
     bool
         If file size is too big.
     """
-    return view.size() > get_settings("file_max_size", 1048576)
+    return view.size() > get_snapshot().file_max_size
+
+
+def large_file_scan_allowed():
+    """Checks whether files bigger than the max_size setting can be scanned in chunks.
+
+    Returns
+    -------
+    bool
+        If files bigger than the max_size setting can be scanned.
+    """
+    return get_snapshot().large_file_scan
 
 
 def highlight_trailing_spaces_regions(view, regions):
@@ -200,37 +675,82 @@ def highlight_trailing_spaces_regions(view, regions):
     # NOTE: Prevent unnecessary regions removal/addition. First, because it's a total waste of
     # resources and second because it causes "blinking" when it's constantly removing/adding regions
     # while typing.
-    if Storage.prev_highlightable == regions:
+    state = Storage.get(view)
+
+    if state.prev_highlightable == regions:
         return
 
-    Storage.prev_highlightable = regions
+    state.prev_highlightable = regions
     view.erase_regions(_plugin_id.format("highlighted-regions"))
     view.add_regions(_plugin_id.format("highlighted-regions"),
                      regions,
-                     get_settings("highlight_color", "invalid.illegal") or "",
+                     get_snapshot().highlight_color,
                      "",
                      sublime.HIDE_ON_MINIMAP)
 
 
-def find_regions_to_delete(view):
+def find_regions_to_delete(view, use_index=False):
     """Finds the trailing spaces regions to be deleted.
 
     Parameters
     ----------
     view : object
         A Sublime Text view.
+    use_index : bool, optional
+        Use the regions found by the live highlighting (if they are up to date) instead of
+        scanning the whole view.
 
     Returns
     -------
     list
         List of regions to be deleted.
     """
+    if use_index and view in Storage and Storage.get(view).valid and not is_scanning(view):
+        # NOTE: Only the lines modified since the last live highlighting pass are scanned.
+        regions = update_trailing_spaces_index(view)
+        pattern = get_snapshot().pattern
+
+        # NOTE: The index could be updated on another thread while it's being read. Check that
+        # the regions are still trailing spaces before deleting them.
+        if pattern is not None and all(is_trailing_spaces_region(view, region, pattern)
+                                       for region in regions):
+            return regions
+
     (regions, highlightable) = find_trailing_spaces(view)
 
     return regions
 
 
-def delete_trailing_regions(view, edit):
+def is_trailing_spaces_region(view, region, pattern):
+    """Check if a region still maps to trailing spaces.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    region : sublime.Region
+        A region.
+    pattern : re.Pattern
+        Compiled regular expression.
+
+    Returns
+    -------
+    bool
+        Whether the region ends at the end of its line and it's matched by the regular expression.
+    """
+    line = view.line(region)
+
+    if region.empty() or region.end() != line.end():
+        return False
+
+    text = view.substr(sublime.Region(line.begin(), region.end()))
+    begin = region.begin() - line.begin()
+    match = pattern.search(text, begin)
+
+    return match is not None and match.start() == begin and match.end() == len(text)
+
+
+def delete_trailing_regions(view, edit, regions=None):
     """Deletes the trailing spaces regions.
 
     Parameters
@@ -239,30 +759,106 @@ def delete_trailing_regions(view, edit):
         A Sublime Text view.
     edit : object
         A Sublime Text edit.
+    regions : None, list, optional
+        Sorted list of regions to delete. If not specified, they are searched for.
 
     Returns
     -------
     int
         The number of deleted regions.
     """
-    regions = find_regions_to_delete(view)
+    if regions is None:
+        regions = find_regions_to_delete(view)
 
-    if regions:
-        # Trick: reversing the regions takes care of the growing offset while
-        # deleting the successive regions.
-        regions.reverse()
-        for r in regions:
-            view.erase(edit, r)
-        return len(regions)
-    else:
+    if not regions:
         return 0
 
+    if len(regions) >= get_settings("bulk_delete_min_regions", 1000):
+        if bulk_delete_trailing_regions(view, edit, regions):
+            return len(regions)
+
+        # NOTE: The merge could have failed after modifying the view.
+        regions = find_regions_to_delete(view)
+
+    # Trick: reversing the regions takes care of the growing offset while
+    # deleting the successive regions.
+    regions.reverse()
+    for r in regions:
+        view.erase(edit, r)
+
+    return len(regions)
+
+
+def bulk_delete_trailing_regions(view, edit, regions):
+    """Deletes the trailing spaces regions by merging the cleaned content of a view.
+
+    The cleaned content is built in a single pass and merged into the view as a diff, instead of
+    erasing each region one by one. Selections are preserved.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    edit : object
+        A Sublime Text edit.
+    regions : list
+        Sorted list of regions to delete.
+
+    Returns
+    -------
+    bool
+        Whether the regions were deleted.
+    """
+    code = view.substr(sublime.Region(0, view.size()))
+    chunks = []
+    prev_end = 0
+
+    for region in regions:
+        chunks.append(code[prev_end:region.begin()])
+        prev_end = region.end()
+
+    chunks.append(code[prev_end:])
+
+    begins = [region.begin() for region in regions]
+    deleted = list(itertools.accumulate(region.size() for region in regions))
+
+    def map_point(point):
+        i = bisect.bisect_right(begins, point) - 1
+
+        if i < 0:
+            return point
+
+        return point - (deleted[i - 1] if i else 0) - min(point - begins[i], regions[i].size())
+
+    selections = [sublime.Region(map_point(sel.a), map_point(sel.b)) for sel in view.sel()]
+    _, err = merge_utils.merge_code(view, edit, code, "".join(chunks))
+
+    if err:
+        logger.error("Trailing Spaces: Merge failure:\n%s" % err)
+        return False
+
+    view.sel().clear()
+    view.sel().add_all(selections)
+
+    return True
+
 
 class OdyseusTsTrailingSpacesListener(sublime_plugin.EventListener):
     """Matches and highlights trailing spaces on key events, according to the
     current settings.
     """
 
+    def on_modified(self, view):
+        """On modified.
+
+        Parameters
+        ----------
+        view : object
+            A Sublime Text view.
+        """
+        if view in Storage:
+            mark_modified_lines(view, _plugin_id.format("dirty-lines"), Storage.get(view))
+
     def on_modified_async(self, view):
         """On modified.
 
@@ -291,43 +887,93 @@ class OdyseusTsTrailingSpacesListener(sublime_plugin.EventListener):
         view : object
             A Sublime Text view.
         """
+        # NOTE: Do not restart scans of big files each time their views are activated.
+        if not is_scanning(view):
+            Storage.get(view).valid = False
+
         self._ody_match(view)
 
+    def on_text_command(self, view, command_name, args):
+        """On text command.
+
+        Parameters
+        ----------
+        view : object
+            A Sublime Text view.
+        command_name : str
+            The command name.
+        args : dict
+            The command arguments.
+        """
+        if command_name in history_commands and view in Storage:
+            Storage.get(view).valid = False
+
+    def on_pre_save(self, view):
+        """On pre save.
+
+        Parameters
+        ----------
+        view : object
+            A Sublime Text view.
+        """
+        if get_settings("trim_on_save", False) and not ignore_view(view):
+            view.run_command("odyseus_ts_delete_trailing_spaces", {"use_index": True})
+
+    def on_close(self, view):
+        """On close.
+
+        Parameters
+        ----------
+        view : object
+            A Sublime Text view.
+        """
+        Storage.pop(view)
+
     def _ody_match(self, view):
-        if get_settings("live_highlight", True):
-            queue.debounce(
-                partial(match_trailing_spaces, view),
-                delay=get_settings("highlight_delay", 0),
-                key=_plugin_id.format("debounce")
-            )
+        if get_snapshot().live_highlight:
+            Scheduler.schedule(view, partial(match_trailing_spaces, view),
+                               delay=get_snapshot().highlight_delay)
 
 
 class OdyseusTsDeleteTrailingSpacesCommand(sublime_plugin.TextCommand):
     """Deletes the trailing spaces.
     """
 
-    def run(self, edit):
+    def run(self, edit, regions=None, change_count=None, use_index=False):
         """Action to perform when this Sublime Text command is executed.
 
         Parameters
         ----------
         edit : object
             A Sublime Text edit.
+        regions : None, list, optional
+            Sorted list of regions (as ``[begin, end]`` lists) to delete. They are only used if
+            ``change_count`` matches the change count of the view.
+        change_count : None, int, optional
+            The change count of the view when ``regions`` were found.
+        use_index : bool, optional
+            Use the regions found by the live highlighting (if they are up to date) instead of
+            scanning the whole view.
 
         Returns
         -------
         None
             Halt execution.
         """
-        if max_size_exceeded(self.view):
+        if max_size_exceeded(self.view) and not large_file_scan_allowed():
             sublime.status_message("File is too big, trailing spaces handling disabled.")
             return
 
-        deleted = delete_trailing_regions(self.view, edit)
+        if regions is not None and change_count == self.view.change_count():
+            regions = [sublime.Region(begin, end) for begin, end in regions]
+        else:
+            regions = find_regions_to_delete(self.view, use_index=use_index)
+
+        deleted = delete_trailing_regions(self.view, edit, regions)
 
         if deleted:
             if get_settings("save_after_trim") and not get_settings("trim_on_save"):
-                sublime.set_timeout(lambda: self.save(self.view), 10)
+                sublime.set_timeout(lambda: self.view.run_command("save"), 10)
 
             message = "Deleted {regions} trailing spaces region{plural}".format(
                 regions=deleted,
@@ -339,6 +985,67 @@ class OdyseusTsDeleteTrailingSpacesCommand(sublime_plugin.TextCommand):
         sublime.status_message(message)
 
 
+class OdyseusTsDeleteTrailingSpacesInAllViewsCommand(sublime_plugin.WindowCommand):
+    """Deletes the trailing spaces in all views of a window.
+
+    Views are processed one at a time. The regions to delete are found in the asynchronous
+    thread and then deleted in the main thread.
+    """
+
+    def run(self):
+        """Action to perform when this Sublime Text command is executed.
+        """
+        views = [view for view in self.window.views()
+                 if not view.is_loading() and not ignore_view(view) and
+                 (not max_size_exceeded(view) or large_file_scan_allowed())]
+
+        self._ody_process_next_view(views, len(views), 0)
+
+    def _ody_process_next_view(self, views, total, deleted):
+        """Process next view.
+
+        Parameters
+        ----------
+        views : list
+            Views left to process.
+        total : int
+            Total number of views to process.
+        deleted : int
+            Number of regions deleted so far.
+        """
+        if not views:
+            message = "Deleted {regions} trailing spaces region{plural} in {total} file{files_plural}"
+            sublime.status_message(message.format(
+                regions=deleted,
+                plural="" if deleted == 1 else "s",
+                total=total,
+                files_plural="" if total == 1 else "s"
+            ))
+            return
+
+        view = views.pop(0)
+        sublime.status_message("Deleting trailing spaces... {current}/{total}".format(
+            current=total - len(views),
+            total=total
+        ))
+
+        def find_regions():
+            change_count = view.change_count()
+            regions = find_regions_to_delete(view, use_index=True) or []
+            sublime.set_timeout(partial(delete_regions, regions, change_count), 0)
+
+        def delete_regions(regions, change_count):
+            if view.is_valid() and regions:
+                view.run_command("odyseus_ts_delete_trailing_spaces", {
+                    "regions": [[region.begin(), region.end()] for region in regions],
+                    "change_count": change_count
+                })
+
+            self._ody_process_next_view(views, total, deleted + len(regions))
+
+        sublime.set_timeout_async(find_regions, 0)
+
+
 class OdyseusTsHighlightTrailingSpacesCommand(sublime_plugin.TextCommand):
     """Highlights trailing spaces.
     """
@@ -356,11 +1063,8 @@ class OdyseusTsHighlightTrailingSpacesCommand(sublime_plugin.TextCommand):
         None
             Halt execution.
         """
-        queue.debounce(
-            partial(match_trailing_spaces, self.view),
-            delay=get_settings("highlight_delay", 0),
-            key=_plugin_id.format("debounce")
-        )
+        Scheduler.schedule(self.view, partial(match_trailing_spaces, self.view),
+                           delay=get_snapshot().highlight_delay)
 
 
 class OdyseusTsToggleLiveHighlightCommand(settings_utils.SettingsToggleBoolean,
@@ -372,15 +1076,19 @@ class OdyseusTsToggleLiveHighlightCommand(settings_utils.SettingsToggleBoolean,
     def run(self):
         super().run()
 
+        global Settings
+        Settings = SettingsSnapshot()
         view = sublime.active_window().active_view()
 
         if not view:
             return
 
-        if get_settings("live_highlight"):
+        if Settings.live_highlight:
+            Storage.get(view).valid = False
             match_trailing_spaces(view)
         else:
             view.erase_regions(_plugin_id.format("highlighted-regions"))
+            Storage.pop(view)
 
 
 if __name__ == "__main__":
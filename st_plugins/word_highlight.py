@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
+import bisect
 import re
 
 from functools import partial
@@ -7,8 +8,12 @@ from functools import partial
 import sublime
 import sublime_plugin
 
+from . import AdaptiveScheduler
+from . import history_commands
+from . import mark_modified_lines
 from . import settings
 from . import settings_utils
+from . import ViewsStorage
 from python_utils.sublime_text_utils import events
 from python_utils.sublime_text_utils import queue
 
@@ -22,6 +27,10 @@ __all__ = [
 ]
 
 _plugin_id = "WordHighlight-{}"
+_max_cached_searches = 32
+_word_re = re.compile(r"\w+")
+# Milliseconds.
+_watch_interval = 200
 
 
 class StorageClass():
@@ -29,9 +38,54 @@ class StorageClass():
         self.prev_selections = None
         self.prev_regions = None
         self.select_next_word_skiped = 0
+        self.occurrences = {}
+        self.occurrences_change_count = None
+        self.word_index = None
+        self.highlighted = []
+        self.highlighted_begins = []
+        self.highlighted_ends = []
+        self.painted_region = None
+        self.watched = None
 
 
-Storage = StorageClass()
+class WordIndexClass():
+    """Index of the words of a view.
+
+    The view is split into chunks of lines. The chunks are stored as hidden regions in the view
+    so Sublime Text keeps their positions in sync with the edits. The lines modified by the edits
+    are also stored as hidden regions and only the chunks that contain them are indexed again.
+
+    Attributes
+    ----------
+    case_sensitive : bool
+        Whether the words are stored as found or lower cased.
+    change_count : None, int
+        The change count of the view the last time the index was synchronized.
+    complete : bool
+        Whether all chunks were indexed.
+    hashes : list
+        The hash of the content of each chunk when it was indexed.
+    rows : None, int
+        The number of rows of the view after the last edit.
+    valid : bool
+        Whether the stored modified lines cover all edits. If not, the content of all chunks is
+        hashed to find the ones that changed.
+    words : list
+        A dictionary for each chunk mapping words to their sorted offsets inside the chunk.
+    """
+
+    def __init__(self, case_sensitive):
+        self.case_sensitive = case_sensitive
+        self.change_count = None
+        self.complete = False
+        self.hashes = []
+        self.rows = None
+        self.valid = False
+        self.words = []
+
+
+Storage = ViewsStorage(StorageClass)
+Scheduler = AdaptiveScheduler(_plugin_id.format("schedule"))
 
 
 @events.on("plugin_loaded")
@@ -39,7 +93,13 @@ def on_plugin_loaded():
     """On plugin loaded.
     """
     global Storage
-    Storage = StorageClass()
+    Storage = ViewsStorage(StorageClass)
+
+
+@events.on("settings_changed")
+def on_settings_changed(settings, **kwargs):
+    for state in Storage.values():
+        state.word_index = None
 
 
 def get_settings(s, default={}):
@@ -69,17 +129,52 @@ def escape_regex(str):
     return str
 
 
-def find_regions(view, regions, string, limited_size):
+def build_search(strings):
+    # NOTE: All strings are searched at once. Longer strings first so they take precedence over
+    # the strings they contain.
+    search = "|".join(escape_regex(string) for string in sorted(strings, key=len, reverse=True))
+
+    if len(strings) > 1:
+        search = "(?:%s)" % search
+
     # It seems as if \b doesn't pay attention to word_separators, but
     # \w does. Hence we use lookaround assertions instead of \b.
     if get_settings("highlight_non_word_characters", False):
-        search = escape_regex(string)
+        return search
     else:
-        search = r"(?<!\w)" + escape_regex(string) + r"(?!\w)"
+        return r"(?<!\w)" + search + r"(?!\w)"
+
+
+def add_counts(counts, texts, increment=1):
+    """Add the occurrences of the found texts to the counts of occurrences.
+
+    Parameters
+    ----------
+    counts : dict
+        The number of occurrences of each word. Words are lower cased if the search isn't case
+        sensitive.
+    texts : list
+        The found texts.
+    increment : int, optional
+        The number added to the count of each text. Use **-1** to remove occurrences.
+    """
+    case_sensitive = get_settings("case_sensitive", True)
+
+    for text in texts:
+        text = text if case_sensitive else text.lower()
+        counts[text] = counts.get(text, 0) + increment
+
+
+def find_regions(view, regions, strings, limited_size, counts=None):
+    search = build_search(strings)
 
     if not limited_size:
-        regions += view.find_all(search, (not get_settings("case_sensitive",
-                                                           True)) * sublime.IGNORECASE)
+        found, texts = find_all_cached(view, search, (not get_settings("case_sensitive",
+                                                                       True)) * sublime.IGNORECASE)
+        regions += found
+
+        if counts is not None:
+            add_counts(counts, texts)
     else:
         chars = get_settings("when_file_size_limit_search_this_num_of_characters", 20000)
         visible_region = view.visible_region()
@@ -96,10 +191,383 @@ def find_regions(view, regions, string, limited_size):
                     from_point = region.end()
             else:
                 break
+
+        # NOTE: The found texts are read at once instead of reading each region.
+        if counts is not None and regions:
+            begin = regions[0].begin()
+            text = view.substr(sublime.Region(begin, regions[-1].end()))
+            add_counts(counts, [text[region.begin() - begin:region.end() - begin]
+                                for region in regions])
+    return regions
+
+
+def find_all_cached(view, search, flags):
+    """Find all occurrences of a search in a view.
+
+    Found occurrences are cached until the view is modified.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    search : str
+        Regular expression.
+    flags : int
+        Search flags.
+
+    Returns
+    -------
+    tuple
+        The found regions and the text of each of them. They must not be modified.
+    """
+    state = Storage.get(view)
+    change_count = view.change_count()
+
+    if state.occurrences_change_count != change_count:
+        state.occurrences = {}
+        state.occurrences_change_count = change_count
+
+    key = (search, flags)
+
+    try:
+        return state.occurrences[key]
+    except KeyError:
+        if len(state.occurrences) >= _max_cached_searches:
+            state.occurrences = {}
+
+        texts = []
+        regions = view.find_all(search, flags, "$0", texts)
+        state.occurrences[key] = (regions, texts)
+
+        return regions, texts
+
+
+def index_words(text, case_sensitive):
+    """Index the words of a text.
+
+    Parameters
+    ----------
+    text : str
+        The text to index.
+    case_sensitive : bool
+        Whether to store the words as found or lower cased.
+
+    Returns
+    -------
+    dict
+        The words mapped to their sorted offsets inside the text.
+    """
+    words = {}
+
+    for match in _word_re.finditer(text):
+        word = match.group() if case_sensitive else match.group().lower()
+
+        try:
+            words[word].append(match.start())
+        except KeyError:
+            words[word] = [match.start()]
+
+    return words
+
+
+def build_word_index(view):
+    """Build the word index of a view in chunks in the background.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    """
+    state = Storage.get(view)
+    index = state.word_index = WordIndexClass(get_settings("case_sensitive", True))
+    chunk_size = get_settings("background_index_chunk_size", 131072)
+    size = view.size()
+    chunks = []
+    begin = 0
+
+    while begin < size:
+        end = min(view.line(min(begin + chunk_size, size)).end() + 1, size)
+        chunks.append(sublime.Region(begin, end))
+        begin = end
+
+    index.hashes = [None] * len(chunks)
+    index.words = [{} for chunk in chunks]
+    index.rows = view.rowcol(size)[0]
+    index.valid = True
+    view.erase_regions(_plugin_id.format("dirty-lines"))
+    view.add_regions(_plugin_id.format("index"), chunks, "", "", sublime.HIDDEN)
+    sublime.set_timeout_async(partial(index_next_chunk, view, index, 0), 0)
+
+
+def index_next_chunk(view, index, i):
+    """Index the next chunk of a view word index.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    index : WordIndexClass
+        The index being built. If the view has a different index, the build stops.
+    i : int
+        The position of the chunk to index.
+    """
+    if not view.is_valid() or view not in Storage or Storage.get(view).word_index is not index:
+        return
+
+    chunks = view.get_regions(_plugin_id.format("index"))
+
+    if i >= len(chunks) or i >= len(index.words):
+        index.complete = True
+        return
+
+    text = view.substr(chunks[i])
+    index.hashes[i] = hash(text)
+    index.words[i] = index_words(text, index.case_sensitive)
+    sublime.set_timeout_async(partial(index_next_chunk, view, index, i + 1), 0)
+
+
+def sync_word_index(view, index):
+    """Index again the chunks of a view word index that contain modified lines.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    index : WordIndexClass
+        The index to synchronize.
+    """
+    change_count = view.change_count()
+
+    if index.change_count == change_count:
+        return
+
+    dirty_lines = view.get_regions(_plugin_id.format("dirty-lines"))
+    dirty_ends = [region.end() for region in dirty_lines]
+    view.erase_regions(_plugin_id.format("dirty-lines"))
+    chunks = []
+    hashes = []
+    words = []
+    prev_end = 0
+
+    for i, chunk in enumerate(view.get_regions(_plugin_id.format("index"))):
+        # NOTE: Text inserted at the boundary of two chunks isn't part of any of them.
+        chunk = sublime.Region(prev_end, max(chunk.end(), prev_end))
+        prev_end = chunk.end()
+
+        # NOTE: Merge chunks that no longer begin at the start of a line. A word could have been
+        # split between them.
+        if chunks and (chunk.empty() or view.substr(chunk.begin() - 1) != "\n"):
+            chunks[-1] = chunks[-1].cover(chunk)
+            hashes[-1] = None
+        else:
+            chunks.append(chunk)
+            hashes.append(index.hashes[i] if i < len(index.hashes) else None)
+            words.append(index.words[i] if i < len(index.words) else {})
+
+    if not chunks:
+        chunks.append(sublime.Region(0, 0))
+        hashes.append(None)
+        words.append({})
+
+    if chunks[-1].end() != view.size():
+        chunks[-1] = sublime.Region(chunks[-1].begin(), view.size())
+        hashes[-1] = None
+
+    for i, chunk in enumerate(chunks):
+        # NOTE: Chunks that don't contain modified lines are skipped without reading their content.
+        if index.valid and hashes[i] is not None:
+            j = bisect.bisect_left(dirty_ends, chunk.begin())
+
+            if j == len(dirty_lines) or dirty_lines[j].begin() > chunk.end():
+                continue
+
+        text = view.substr(chunk)
+        text_hash = hash(text)
+
+        if text_hash != hashes[i]:
+            hashes[i] = text_hash
+            words[i] = index_words(text, index.case_sensitive)
+
+    view.add_regions(_plugin_id.format("index"), chunks, "", "", sublime.HIDDEN)
+    index.hashes = hashes
+    index.words = words
+    index.change_count = change_count
+    # NOTE: If the view was modified while synchronizing, the modified lines might have been
+    # erased without being indexed. Hash all chunks on the next synchronization.
+    index.valid = change_count == view.change_count()
+
+
+def find_indexed_regions(view, strings, counts=None):
+    """Find the occurrences of words using the word index of a view.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    strings : list
+        The words to find.
+    counts : None, dict, optional
+        If specified, the number of occurrences of each word is added to it.
+
+    Returns
+    -------
+    None, list
+        The sorted occurrences of the words. None if the index isn't ready or it can't be used
+        to find the words.
+    """
+    if get_settings("highlight_non_word_characters", False):
+        return None
+
+    for string in strings:
+        match = _word_re.match(string)
+
+        if match is None or match.end() != len(string):
+            return None
+
+    state = Storage.get(view)
+    index = state.word_index
+
+    if index is None:
+        build_word_index(view)
+        return None
+
+    if not index.complete:
+        return None
+
+    sync_word_index(view, index)
+
+    regions = []
+    chunks = view.get_regions(_plugin_id.format("index"))
+
+    for string in strings:
+        word = string if index.case_sensitive else string.lower()
+
+        for chunk, words in zip(chunks, index.words):
+            begin = chunk.begin()
+            offsets = words.get(word, ())
+            regions.extend(sublime.Region(begin + offset, begin + offset + len(string))
+                           for offset in offsets)
+
+            if counts is not None and offsets:
+                counts[word] = counts.get(word, 0) + len(offsets)
+
+    if len(strings) > 1:
+        regions.sort(key=lambda r: r.begin())
+
     return regions
 
 
+def exclude_selections(view, regions, excluded=None):
+    """Exclude the regions containing a selection.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    regions : list
+        Sorted list of non overlapping regions.
+    excluded : None, list, optional
+        If specified, the excluded regions are added to it.
+
+    Returns
+    -------
+    list
+        The regions that do not contain a selection.
+    """
+    sels = list(view.sel())
+    i = 0
+    result = []
+
+    for region in regions:
+        # NOTE: Both lists are sorted. Selections that begin before a region cannot be
+        # contained by it nor by the regions after it.
+        while i < len(sels) and sels[i].begin() < region.begin():
+            i += 1
+
+        if i < len(sels) and sels[i].end() <= region.end():
+            if excluded is not None:
+                excluded.append(region)
+
+            continue
+
+        result.append(region)
+
+    return result
+
+
+def count_occurrences(counts, strings):
+    """Get the messages with the number of occurrences of each string.
+
+    Parameters
+    ----------
+    counts : dict
+        The number of occurrences of each word. Words are lower cased if the search isn't case
+        sensitive.
+    strings : list
+        The searched strings.
+
+    Returns
+    -------
+    list
+        Messages with the number of occurrences of each string.
+    """
+    case_sensitive = get_settings("case_sensitive", True)
+    occurrences_message = []
+
+    for string in strings:
+        occurrences = counts.get(string if case_sensitive else string.lower(), 0)
+
+        if occurrences > 0:
+            occurrences_message.append('"' + string + '" ' + str(occurrences) + " ")
+
+    return occurrences_message
+
+
 def delayed_highlight(view, regions, occurrences_message, limited_size):
+    state = Storage.get(view)
+    state.highlighted = regions
+    state.highlighted_begins = [region.begin() for region in regions]
+    state.highlighted_ends = [region.end() for region in regions]
+
+    paint_regions(view, state)
+
+    if get_settings("show_word_highlight_status_bar_message", False):
+        view.set_status(_plugin_id.format("status"),
+                        ", ".join(list(set(occurrences_message))) +
+                        (" found on a limited portion of the document " if limited_size else ""))
+
+
+def paint_regions(view, state):
+    """Paint the highlighted regions of a view.
+
+    If only the visible region should be painted, only the regions inside the visible region
+    (plus a margin) are painted and the view is watched to paint them again when the visible
+    region changes.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    state : StorageClass
+        The state of the view.
+    """
+    regions = state.highlighted
+
+    if get_settings("paint_visible_region_only", False):
+        margin = get_settings("paint_margin", 10000)
+        visible_region = view.visible_region()
+        state.painted_region = sublime.Region(max(visible_region.begin() - margin, 0),
+                                              visible_region.end() + margin)
+        regions = regions[
+            bisect.bisect_left(state.highlighted_begins, state.painted_region.begin()):
+            bisect.bisect_right(state.highlighted_begins, state.painted_region.end())
+        ]
+
+        if state.watched is not state.highlighted:
+            state.watched = state.highlighted
+            sublime.set_timeout_async(partial(watch_visible_region, view, state.highlighted),
+                                      _watch_interval)
+
     view.add_regions(
         _plugin_id.format("regions"),
         regions,
@@ -114,27 +582,121 @@ def delayed_highlight(view, regions, occurrences_message, limited_size):
         get_settings("draw_no_outline", True) * sublime.DRAW_NO_OUTLINE |
         get_settings("draw_solid_underline", True) * sublime.DRAW_SOLID_UNDERLINE)
 
-    if get_settings("show_word_highlight_status_bar_message", False):
-        view.set_status(_plugin_id.format("status"),
-                        ", ".join(list(set(occurrences_message))) +
-                        (" found on a limited portion of the document " if limited_size else ""))
+
+def watch_visible_region(view, regions):
+    """Paint the highlighted regions of a view again when its visible region changes.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    regions : list
+        The highlighted regions being watched. If the view highlights other regions, the watch
+        stops.
+    """
+    if not view.is_valid() or view not in Storage:
+        return
+
+    state = Storage.get(view)
+
+    if state.watched is not regions or state.highlighted is not regions or \
+            not get_settings("paint_visible_region_only", False):
+        state.watched = None if state.watched is regions else state.watched
+        return
+
+    window = view.window()
+
+    # NOTE: Stop watching hidden views. Regions are painted again when they are activated.
+    if window is None or window.active_view_in_group(window.get_view_index(view)[0]) != view:
+        state.watched = None
+        return
+
+    if not state.painted_region.contains(view.visible_region()):
+        paint_regions(view, state)
+
+    sublime.set_timeout_async(partial(watch_visible_region, view, regions), _watch_interval)
+
+
+def get_highlighted_regions(view):
+    """Get all the highlighted regions of a view, painted or not.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+
+    Returns
+    -------
+    list
+        The sorted highlighted regions.
+    """
+    return Storage.get(view).highlighted or view.get_regions(_plugin_id.format("regions"))
+
+
+def find_next_highlighted_region(view, point):
+    """Find the first highlighted region of a view that ends after a point.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    point : int
+        A point in the view.
+
+    Returns
+    -------
+    None, sublime.Region
+        The found region, if any.
+    """
+    state = Storage.get(view)
+
+    if state.highlighted:
+        regions = state.highlighted
+        ends = state.highlighted_ends
+    else:
+        regions = view.get_regions(_plugin_id.format("regions"))
+        ends = [region.end() for region in regions]
+
+    # NOTE: Highlighted regions don't overlap, so their ends are sorted too.
+    i = bisect.bisect_right(ends, point)
+
+    return regions[i] if i < len(regions) else None
+
+
+def erase_highlighted_regions(view, state):
+    """Erase the highlighted regions of a view.
+
+    Parameters
+    ----------
+    view : object
+        A Sublime Text view.
+    state : StorageClass
+        The state of the view.
+    """
+    view.erase_regions(_plugin_id.format("regions"))
+    state.highlighted = []
+    state.highlighted_begins = []
+    state.highlighted_ends = []
 
 
 def highlight_occurences(view):
+    state = Storage.get(view)
+
     if not get_settings("highlight_when_selection_is_empty",
                         False) and not view.has_non_empty_selection_region():
         view.erase_status(_plugin_id.format("status"))
-        view.erase_regions(_plugin_id.format("regions"))
-        Storage.prev_regions = None
-        Storage.prev_selections = None
+        erase_highlighted_regions(view, state)
+        state.prev_regions = None
+        state.prev_selections = None
         return
-    # todo: The list cast below can go away when Sublime 3's Selection class implements __str__
-    prev_selections = str(list(view.sel()))
+    # NOTE: The change count is part of the fingerprint because edits can change the occurrences
+    # without changing the selections.
+    prev_selections = (view.change_count(), tuple((sel.a, sel.b) for sel in view.sel()))
 
-    if Storage.prev_selections == prev_selections:
+    if state.prev_selections == prev_selections:
         return
     else:
-        Storage.prev_selections = prev_selections
+        state.prev_selections = prev_selections
 
     if view.size() <= get_settings("file_size_limit", 4194304):
         limited_size = False
@@ -144,41 +706,64 @@ def highlight_occurences(view):
     # print "running"+ str(time.time())
 
     regions = []
-    processed_words = []
-    occurrences_message = []
-    occurrences_count = 0
+    strings = []
+    processed_words = set()
+    exclude_cursors = False
     word_separators = view.settings().get("word_separators", "")
     for sel in view.sel():
         if get_settings("highlight_when_selection_is_empty", False) and sel.empty():
             string = view.substr(view.word(sel)).strip()
             if string not in processed_words:
-                processed_words.append(string)
+                processed_words.add(string)
                 if string and all([c not in word_separators for c in string]):
-                    regions = find_regions(view, regions, string, limited_size)
+                    strings.append(string)
                 if not get_settings("highlight_word_under_cursor_when_selection_is_empty", False):
-                    for s in view.sel():
-                        regions = [r for r in regions if not r.contains(s)]
+                    exclude_cursors = True
         elif not sel.empty() and get_settings("highlight_non_word_characters", False):
             string = view.substr(sel)
             if string and string not in processed_words:
-                processed_words.append(string)
-                regions = find_regions(view, regions, string, limited_size)
+                processed_words.add(string)
+                strings.append(string)
         elif not sel.empty():
             word = view.word(sel)
             if word.end() == sel.end() and word.begin() == sel.begin():
                 string = view.substr(word).strip()
                 if string not in processed_words:
-                    processed_words.append(string)
+                    processed_words.add(string)
                     if string and all([c not in word_separators for c in string]):
-                        regions = find_regions(view, regions, string, limited_size)
+                        strings.append(string)
 
-        occurrences = len(regions) - occurrences_count
-        if occurrences > 0:
-            occurrences_message.append('"' + string + '" ' + str(occurrences) + " ")
-            occurrences_count = occurrences_count + occurrences
+    counts = {} if get_settings("show_word_highlight_status_bar_message", False) else None
+
+    if strings:
+        indexed_regions = find_indexed_regions(view, strings, counts) if limited_size and \
+            get_settings("background_index", False) else None
+
+        if indexed_regions is not None:
+            regions = indexed_regions
+            limited_size = False
+        else:
+            regions = find_regions(view, regions, strings, limited_size, counts)
+
+        if exclude_cursors:
+            excluded = []
+            regions = exclude_selections(view, regions, excluded)
+
+            if counts:
+                # NOTE: Only the few regions containing a selection are read.
+                add_counts(counts, [view.substr(region) for region in excluded], -1)
+
+    if regions and counts is not None:
+        occurrences_message = count_occurrences(counts, strings)
+    else:
+        occurrences_message = []
+
+    # NOTE: The highlighted regions are forgotten when the view is modified. Highlight them again
+    # even if the occurrences didn't move.
+    if state.prev_regions != regions or (regions and not state.highlighted):
+        if state.prev_regions != regions:
+            erase_highlighted_regions(view, state)
 
-    if Storage.prev_regions != regions:
-        view.erase_regions(_plugin_id.format("regions"))
         if regions:
             queue.debounce(
                 partial(delayed_highlight,
@@ -192,14 +777,12 @@ def highlight_occurences(view):
         else:
             view.erase_status(_plugin_id.format("status"))
 
-        Storage.prev_regions = regions
+        state.prev_regions = regions
 
 
 class OdyseusWhSelectHighlightedWordsCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        wh = self.view.get_regions(_plugin_id.format("regions"))
-        for w in wh:
-            self.view.sel().add(w)
+        self.view.sel().add_all(get_highlighted_regions(self.view))
 
 
 class OdyseusWhSelectHighlightedNextWordCommand(sublime_plugin.TextCommand):
@@ -208,13 +791,13 @@ class OdyseusWhSelectHighlightedNextWordCommand(sublime_plugin.TextCommand):
         sel.reverse()
         if sel:
             word = sel[0]
-            wh = self.view.get_regions(_plugin_id.format("regions"))
-            for w in wh:
-                if w.end() > word.end() and w.end() > Storage.select_next_word_skiped:
-                    self.view.sel().add(w)
-                    self.view.show(w)
-                    Storage.select_next_word_skiped = w.end()
-                    break
+            state = Storage.get(self.view)
+            w = find_next_highlighted_region(
+                self.view, max(word.end(), state.select_next_word_skiped))
+            if w is not None:
+                self.view.sel().add(w)
+                self.view.show(w)
+                state.select_next_word_skiped = w.end()
 
 
 class OdyseusWhSelectHighlightedSkipLastWordCommand(sublime_plugin.TextCommand):
@@ -223,33 +806,55 @@ class OdyseusWhSelectHighlightedSkipLastWordCommand(sublime_plugin.TextCommand):
         sel.reverse()
         if sel and len(sel) > 1:
             self.view.sel().subtract(sel[0])
-            Storage.select_next_word_skiped = sel[0].end()
+            Storage.get(self.view).select_next_word_skiped = sel[0].end()
 
 
 class OdyseusWhWordHighlightClickCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        Storage.select_next_word_skiped = 0
         view = self.view
+        Storage.get(view).select_next_word_skiped = 0
         if get_settings("live_highlight") and not view.settings().get("is_widget"):
             highlight_occurences(view)
 
 
 class OdyseusWhWordHighlightListener(sublime_plugin.EventListener):
     def on_activated_async(self, view):
-        Storage.prev_selections = None
-        Storage.select_next_word_skiped = 0
+        state = Storage.get(view)
+        state.select_next_word_skiped = 0
 
         if not view.is_loading() and not get_settings("live_highlight"):
             view.erase_regions(_plugin_id.format("regions"))
+            Storage.pop(view)
+        elif state.highlighted and get_settings("paint_visible_region_only", False):
+            paint_regions(view, state)
+
+    def on_close(self, view):
+        Storage.pop(view)
+
+    def on_modified(self, view):
+        if view not in Storage:
+            return
+
+        state = Storage.get(view)
+        # NOTE: The offsets of the highlighted regions are outdated until they are highlighted
+        # again. The painted regions are kept in sync by Sublime Text and are used meanwhile.
+        state.highlighted = []
+        state.highlighted_begins = []
+        state.highlighted_ends = []
+
+        if state.word_index is not None:
+            mark_modified_lines(view, _plugin_id.format("dirty-lines"), state.word_index)
+
+    def on_text_command(self, view, command_name, args):
+        if command_name in history_commands and view in Storage and \
+                Storage.get(view).word_index is not None:
+            Storage.get(view).word_index.valid = False
 
     def on_selection_modified_async(self, view):
         if view and len(view.sel()) and get_settings(
                 "live_highlight") and not view.settings().get("is_widget"):
-            queue.debounce(
-                partial(highlight_occurences, view),
-                delay=get_settings("highlight_delay", 0),
-                key=_plugin_id.format("debounce")
-            )
+            Scheduler.schedule(view, partial(highlight_occurences, view),
+                               delay=get_settings("highlight_delay", 0))
 
 
 class OdyseusWhToggleLiveHighlightCommand(settings_utils.SettingsToggleBoolean,
@@ -270,6 +875,7 @@ class OdyseusWhToggleLiveHighlightCommand(settings_utils.SettingsToggleBoolean,
             highlight_occurences(view)
         else:
             view.erase_regions(_plugin_id.format("regions"))
+            Storage.pop(view)
 
 
 if __name__ == "__main__":